@@ -9,6 +9,11 @@ import tempfile
 
 import werender as wr
 
+# helpers shared by the explore examples live in explore/common/py
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'common', 'py'))
+from upload_cache import CachedSession
+
 # a convenience function to find all assets via env var
 def resolve_file(filename):
     return os.path.join(
@@ -98,5 +103,5 @@ def main(session):
     result.download_image(tempfile.gettempdir(), '3d_noise_disp.jpg')
 
 if __name__ == '__main__':
-    session = wr.authenticate()
+    session = CachedSession(wr.authenticate())
     main(session)
@@ -9,6 +9,12 @@ import tempfile
 
 import werender as wr
 
+# helpers shared by the explore examples live in explore/common/py
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'common', 'py'))
+from texture_prep import TexturePrep
+from upload_cache import CachedSession
+
 # a convenience function to find all assets via env var
 def resolve_file(filename):
     return os.path.join(
@@ -16,7 +22,7 @@ def resolve_file(filename):
 
 
 #
-def main(session):
+def main(session, texture_proxies=False):
     # log file
     wr.set_log_file(os.path.join(tempfile.gettempdir(), 'bump.log'))
 
@@ -26,7 +32,13 @@ def main(session):
     # assets
     group_asset = session.upload(resolve_file('group.usd'), remote_folder)
     ground_asset = session.upload(resolve_file('ground.usd'), remote_folder)
-    tex_normal_asset = session.upload(resolve_file('rock_clifflayer_bumpdisp_rgb.tif'), remote_folder)
+    tex_file = resolve_file('rock_clifflayer_bumpdisp_rgb.tif')
+    if texture_proxies:
+        # downscaled for the render resolution
+        prep = TexturePrep((1280, 720))
+        tex_file = prep.prepare([tex_file])[tex_file]
+        print(prep.report())
+    tex_normal_asset = session.upload(tex_file, remote_folder)
 
     # create a scene
     scene = wr.Scene()
@@ -97,5 +109,5 @@ def main(session):
     result.download_image(tempfile.gettempdir(), 'bump.jpg')
 
 if __name__ == '__main__':
-    session = wr.authenticate()
+    session = CachedSession(wr.authenticate())
     main(session)
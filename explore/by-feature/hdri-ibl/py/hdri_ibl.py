@@ -8,6 +8,11 @@ import tempfile
 
 import werender as wr
 
+# helpers shared by the explore examples live in explore/common/py
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'common', 'py'))
+from upload_cache import CachedSession
+
 # a convenience function to find all assets via env var
 def resolve_file(filename):
     return os.path.join(
@@ -15,7 +20,7 @@ def resolve_file(filename):
 
 
 #
-def main(session):
+def main(session, prepare_hdri=False, hdri_width=None):
     # log file
     wr.set_log_file(os.path.join(tempfile.gettempdir(), 'envhdri.log'))
 
@@ -25,7 +30,12 @@ def main(session):
     # assets
     group_asset = session.upload(resolve_file('tetra_group.usd'), remote_folder)
     ground_asset = session.upload(resolve_file('ground.usd'), remote_folder)
-    hdri_asset = session.upload(resolve_file('snow.exr'), remote_folder)
+    hdri_file = resolve_file('snow.exr')
+    if prepare_hdri:
+        # half-float, optionally downsampled (needs numpy and OpenEXR)
+        from hdri_prep import HdriPrep
+        hdri_file = HdriPrep(max_width=hdri_width).prepare(hdri_file)[0]
+    hdri_asset = session.upload(hdri_file, remote_folder)
 
     # create a scene
     scene = wr.Scene()
@@ -94,5 +104,5 @@ def main(session):
     result.download_image(tempfile.gettempdir(), 'hdri_ibl.jpg')
 
 if __name__ == '__main__':
-    session = wr.authenticate()
+    session = CachedSession(wr.authenticate())
     main(session)
@@ -10,6 +10,13 @@ import tempfile
 
 import werender as wr
 
+# helpers shared by the explore examples live in explore/common/py
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'common', 'py'))
+import scene_recipe as sr
+from prim_index import check_material_bindings
+from upload_cache import CachedSession
+
 # a convenience function to find all assets via env var
 def resolve_file(filename):
     return os.path.join(
@@ -24,20 +31,17 @@ def main(session):
     # where to store assets in the cloud storage
     remote_folder = '/assets/examples'
 
-    # assets
-    porsche_asset = session.upload(resolve_file('porsche.usd'), remote_folder)
-    ground_asset = session.upload(resolve_file('ground_car.usd'), remote_folder)
-
-    # create a scene
-    scene = wr.Scene()
+    # create a scene, described as a recipe so that it can be checked
+    recipe = sr.SceneRecipe()
+    scene = recipe.scene
 
-    # create models
-    porsche = scene.new_model(porsche_asset)
-    ground = scene.new_model(ground_asset)
+    # create models, the assets are uploaded once the scene is described
+    porsche = scene.new_model(recipe.asset('porsche.usd'))
+    ground = scene.new_model(recipe.asset('ground_car.usd'))
 
     # create persp camera, create and apply transform, set attributes
     camera = scene.new_camera(wr.cameras.Persp)
-    camera_xform = wr.Transform(
+    camera_xform = sr.Transform(
         translate=(0.0, 165.009, -444.921),
         rotate=(162.8, 0.0, -180.0))
     camera.set_xform(camera_xform)
@@ -68,42 +72,42 @@ def main(session):
     # set material attributes
 
     mat_glass.set_ior(5.0)
-    mat_glass.set_reflection_color(wr.Color(0.6, 0.6, 0.6))
+    mat_glass.set_reflection_color(sr.Color(0.6, 0.6, 0.6))
     mat_glass.set_reflection_ior(5.0)
     mat_glass.set_thin_film_thickness(0.25)
     mat_glass.set_thin_film_ior(2.0)
 
-    mat_carpaint.set_color(wr.Color(0.1, 0.294, 0.9))
-    mat_carpaint.set_coating_color(wr.Color(0.2, 0.372, 0.8))
-    mat_carpaint.set_flakes_color(wr.Color(0.2, 0.426, 1.0))
+    mat_carpaint.set_color(sr.Color(0.1, 0.294, 0.9))
+    mat_carpaint.set_coating_color(sr.Color(0.2, 0.372, 0.8))
+    mat_carpaint.set_flakes_color(sr.Color(0.2, 0.426, 1.0))
     mat_carpaint.set_flakes_scale(10.0)
 
-    mat_breakes.set_color(wr.Color(1.0, 0.0, 0.0))
+    mat_breakes.set_color(sr.Color(1.0, 0.0, 0.0))
     mat_breakes.set_roughness(0.2)
     mat_breakes.set_specular_level(2.0)
 
-    mat_carbon.set_color(wr.Color(0.154, 0.140, 0.131))
-    mat_carbon.set_edge_color(wr.Color(1.0, 0.85, 0.796))
+    mat_carbon.set_color(sr.Color(0.154, 0.140, 0.131))
+    mat_carbon.set_edge_color(sr.Color(1.0, 0.85, 0.796))
     mat_carbon.set_roughness(0.4)
 
-    mat_rubber.set_color(wr.Color(0.01, 0.01, 0.01))
+    mat_rubber.set_color(sr.Color(0.01, 0.01, 0.01))
     mat_rubber.set_roughness(0.7)
     mat_rubber.set_specular_level(0.3)
 
-    mat_silver.set_color(wr.Color(0.9, 0.9, 0.9))
-    mat_silver.set_edge_color(wr.Color(1.0, 1.0, 1.0))
+    mat_silver.set_color(sr.Color(0.9, 0.9, 0.9))
+    mat_silver.set_edge_color(sr.Color(1.0, 1.0, 1.0))
     mat_silver.set_roughness(0.131)
 
-    mat_redlight.set_color(wr.Color(1.0, 0.0, 0.0))
+    mat_redlight.set_color(sr.Color(1.0, 0.0, 0.0))
     mat_redlight.set_opacity(0.25)
 
-    mat_orangelight.set_color(wr.Color(1.0, 0.5, 0.0))
+    mat_orangelight.set_color(sr.Color(1.0, 0.5, 0.0))
     mat_orangelight.set_opacity(0.25)
 
-    mat_leather.set_color(wr.Color(1.0, 0.6, 0.4))
+    mat_leather.set_color(sr.Color(1.0, 0.6, 0.4))
     mat_leather.set_roughness(0.4)
 
-    mat_interior.set_color(wr.Color(0.3, 0.3, 0.3))
+    mat_interior.set_color(sr.Color(0.3, 0.3, 0.3))
     mat_interior.set_roughness(0.4)
 
     tex_noise = scene.new_texture(wr.textures.Noise)
@@ -111,7 +115,7 @@ def main(session):
     tex_noise.set_time(1.863)
     tex_noise.set_layers_contrast(2.0)
 
-    mat_ground.set_color(wr.Color(0.0, 0.0, 0.0))
+    mat_ground.set_color(sr.Color(0.0, 0.0, 0.0))
     mat_ground.set_roughness(tex_noise)
     mat_ground.set_specular_level(1.0)
     mat_ground.set_height(tex_noise)
@@ -140,12 +144,21 @@ def main(session):
     scene.set_active_camera(camera)
 
     # create render settings
-    settings = wr.RenderSettings()
+    settings = recipe.settings
     settings.set_resolution(1920, 1080)
     settings.set_image_name('automotive_porsche911.jpg')
     # specify where renders will be stored in the cloud storage
     settings.set_remote_folder('/MyRenders/examples')
 
+    # report the material assignments matching no prim of the assets before
+    # paying for a render (needs the assets locally)
+    for warning in check_material_bindings(recipe, resolve_file):
+        print('warning: ' + warning)
+
+    # assets
+    assets = sr.upload_assets(session, recipe, remote_folder, resolve_file)
+    scene, settings = recipe.build(assets)
+
     # now we render!
     result = session.start_render_and_wait(settings, scene)
 
@@ -153,5 +166,5 @@ def main(session):
     result.download_image(tempfile.gettempdir(), 'automotive_porsche911.jpg')
 
 if __name__ == '__main__':
-    session = wr.authenticate()
+    session = CachedSession(wr.authenticate())
     main(session)
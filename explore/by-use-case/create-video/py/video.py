@@ -3,41 +3,64 @@
 #   by use-case: create video
 
 import os
+import sys
 import tempfile
-import time
+import threading
 
 import werender as wr
 
+# helpers shared by the explore examples live in explore/common/py
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'common', 'py'))
+import scene_recipe as sr
+from frame_sequence import FrameSequence
+from preview_first import PreviewFirst
+from render_cache import RenderCache, asset_digests
+from render_queue import as_completed
+from upload_cache import CachedSession
+
 
 def resolve_file(filename):
     return os.path.join(
         os.environ.get('WERENDER_ASSETS_PATH', './'), filename)
 
 
-def render_frames(session):
-    """Renders frames of a rotating maneki and then createts a video."""
+def render_frames(session, max_retries=2, preview_step=0):
+    """Renders frames of a rotating maneki and then createts a video.
+
+    Failed frames are submitted again (up to `max_retries` times) while the
+    other frames keep rendering, and the video clip is created as soon as the
+    last frame lands. Frames rendered by a previous run with the same scene
+    are reused instead of being rendered again.
+
+    With a `preview_step` (e.g. 4), low resolution previews of every
+    `preview_step`-th frame, then of the others, are rendered first and land
+    in `rotating_maneki_preview` in the temporary folder. They are extra
+    render jobs, hence off by default.
+    """
     maneki_asset = session.upload(resolve_file('maneki.usdz'), '/assets')
     plane_asset = session.upload(resolve_file('plane.usd'), '/assets')
 
-    scene = wr.Scene()
+    recipe = sr.SceneRecipe()
+    scene = recipe.scene
 
-    maneki = scene.new_model(maneki_asset)
-    plane = scene.new_model(plane_asset)
+    recipe.name('maneki', scene.new_model(recipe.asset('maneki.usdz')))
+    plane = scene.new_model(recipe.asset('plane.usd'))
 
     camera = scene.new_camera(wr.cameras.Persp)
     camera.set_focal_length(45.0)
-    camera_xform = wr.Transform(
+    camera_xform = sr.Transform(
         translate=(0.0, 23.0, 32.0),
         rotate=(-25.0, 0.0, 0.0))
     camera.set_xform(camera_xform)
 
-    settings = wr.RenderSettings()
+    settings = recipe.settings
     settings.set_resolution(512, 512)
     settings.set_remote_folder('/MyRenders/rotating_maneki')
 
     area_light = scene.new_light(wr.lights.Area)
     area_light.set_intensity(500.0)
-    area_light.set_xform(wr.Transform(
+    area_light.set_xform(sr.Transform(
         translate=(11.0, 12.0, 8.0),
         rotate=(-24.0, 50.0, 0.0),
         scale=(4.0, 4.0, 4.0)))
@@ -46,34 +69,73 @@ def render_frames(session):
     env_light.set_intensity(0.3)
 
     num_frames = 12
-    turntable_xform = wr.Transform()
 
-    requests = []
+    sequence = FrameSequence(recipe)
     for frame in range(num_frames):
-        turntable_xform.set_rotation(0.0, 360.0 / num_frames * frame, 0.0)
-        maneki.set_xform(turntable_xform)
-
-        settings.set_image_name('rotating_maneki_{:02d}.png'.format(frame))
-        requests.append(session.start_render(settings, scene))
-
-    status_list = [session.query_render(request) for request in requests]
-    while not all([status.done for status in status_list]):
-        print('waiting for renders...')
-        time.sleep(1)
-        status_list = [session.query_render(request) for request in requests]
-
-    if any([status.failed for status in status_list]):
-        print('one or more renders have failed!')
-        return
-
-    # Retrieve asset information from the render results.
-    render_assets = [status.get_result().get_asset() for status in status_list]
-
+        turntable_xform = sr.Transform(
+            rotate=(0.0, 360.0 / num_frames * frame, 0.0))
+        sequence.add(frame, 'rotating_maneki_{:02d}.png'.format(frame),
+                     {'maneki.set_xform': turntable_xform})
+
+    assets = {'maneki.usdz': maneki_asset, 'plane.usd': plane_asset}
+    cache = RenderCache()
+    asset_keys = asset_digests(session, assets, resolve_file)
+
+    # The previews land on another thread: progress lines are printed whole.
+    lock = threading.Lock()
+
+    def report(message):
+        with lock:
+            print(message)
+
+    streamer = None
+    if preview_step:
+        preview = PreviewFirst(sequence, step=preview_step)
+        previews, requests = preview.submit(session, assets, cache=cache,
+                                            asset_keys=asset_keys)
+        streamer = preview.stream(session, previews, os.path.join(
+            tempfile.gettempdir(), 'rotating_maneki_preview'), report)
+    else:
+        requests = sequence.submit(session, assets, cache=cache,
+                                   asset_keys=asset_keys)
+    report(cache.report())
+
+    # Submit failed frames again without waiting for the other frames.
+    retries = [0] * num_frames
+
+    def retry(frame, request, status):
+        if retries[frame] == max_retries:
+            return None
+        retries[frame] += 1
+        report('frame {} failed, retrying...'.format(frame))
+        return sequence.submit_frame(session, assets, frame, cache, asset_keys)
+
+    # Collect the frames as they arrive, reporting the ready prefix.
+    report('waiting for renders...')
+    render_assets = [None] * num_frames
+    ready = 0
+    for frame, request, status in as_completed(session, requests, retry=retry):
+        if status.failed:
+            report('frame {} has failed {} times!'.format(
+                frame, max_retries + 1))
+            return
+        cache.complete(request, status)
+        # Retrieve asset information from the render result.
+        render_assets[frame] = status.get_result().get_asset()
+        while ready < num_frames and render_assets[ready] is not None:
+            ready += 1
+        report('frames ready: {}/{} ({} in sequence)'.format(
+            num_frames - render_assets.count(None), num_frames, ready))
+
+    # The last frame just landed: create the clip straight away.
     video_settings = wr.VideoSettings()
     video_settings.set_filename('rotating_maneki.mp4')
     output_asset = session.create_video_clip(render_assets, video_settings)
     session.download_asset(output_asset, tempfile.gettempdir())
 
+    if streamer is not None:
+        streamer.join()
+
 
 def create_video_from_rendered_images(session):
     """Creates a video using existing (remote) rendered frames."""
@@ -90,7 +152,7 @@ def create_video_from_rendered_images(session):
 
 
 if __name__ == "__main__":
-    session = wr.authenticate()
+    session = CachedSession(wr.authenticate())
 
     # Use this function to render the animation frames and create a video for
     # it straight after the renders are done.
@@ -7,6 +7,11 @@ import tempfile
 
 import werender as wr
 
+# helpers shared by the explore examples live in explore/common/py
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'common', 'py'))
+from upload_cache import CachedSession
+
 # a convenience function to find all assets via env var
 def resolve_file(filename):
     return os.path.join(
@@ -14,7 +19,7 @@ def resolve_file(filename):
 
 
 #
-def main(session):
+def main(session, prepare_hdri=False, hdri_width=None):
     # log file
     wr.set_log_file(os.path.join(tempfile.gettempdir(), 'flat_360cam.log'))
 
@@ -23,7 +28,12 @@ def main(session):
 
     # upload assets
     flat_asset = session.upload(resolve_file('flat_vr.fbx'), remote_folder)
-    hdri_asset = session.upload(resolve_file('beach.exr'), remote_folder)
+    hdri_file = resolve_file('beach.exr')
+    if prepare_hdri:
+        # half-float, optionally downsampled (needs numpy and OpenEXR)
+        from hdri_prep import HdriPrep
+        hdri_file = HdriPrep(max_width=hdri_width).prepare(hdri_file)[0]
+    hdri_asset = session.upload(hdri_file, remote_folder)
     art1_asset = session.upload(resolve_file('art1.jpg'), remote_folder)
     art2_asset = session.upload(resolve_file('art2.jpg'), remote_folder)
 
@@ -121,5 +131,5 @@ def main(session):
     result.download_image(tempfile.gettempdir(), 'flat_360cam.png')
 
 if __name__ == '__main__':
-    session = wr.authenticate()
+    session = CachedSession(wr.authenticate())
     main(session)
@@ -3,11 +3,20 @@
 #   by use-case: animation
 
 import os
+import sys
 import tempfile
-import time
 
 import werender as wr
 
+# helpers shared by the explore examples live in explore/common/py
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'common', 'py'))
+import scene_recipe as sr
+from anim_curves import AnimCurves
+from frame_sequence import FrameSequence
+from render_queue import process_as_completed
+from upload_cache import CachedSession
+
 
 def resolve_file(filename):
     return os.path.join(
@@ -84,29 +93,41 @@ def turntable_async(session):
     render job on the cloud and returns immediately an object of type
     `RenderRequest`. Such object can be used to query the status of the render
     and finally obtain and download the rendered image.
+
+    The scene, keyframes included, is described once: each frame only adds
+    its delta, i.e. the frame number and the image name. The model keyframes
+    are evaluated locally by `AnimCurves`, which only keys the instants the
+    camera shutter of each frame spans and the keyframes inside them.
     """
     maneki_asset = session.upload(resolve_file('maneki.usdz'), '/assets')
     plane_asset = session.upload(resolve_file('plane.usd'), '/assets')
 
-    scene = wr.Scene()
+    recipe = sr.SceneRecipe()
+    scene = recipe.scene
 
-    maneki = scene.new_model(maneki_asset)
-    plane = scene.new_model(plane_asset)
+    maneki = scene.new_model(recipe.asset('maneki.usdz'))
+    plane = scene.new_model(recipe.asset('plane.usd'))
 
     camera = scene.new_camera(wr.cameras.Persp)
     camera.set_focal_length(45.0)
-    camera_xform = wr.Transform(
+    camera_xform = sr.Transform(
         translate=(0.0, 23.0, 32.0),
         rotate=(-25.0, 0.0, 0.0))
     camera.set_xform(camera_xform)
+    # Set shutter open/close to half time.
+    shutter_open, shutter_close = -0.5, 0.5
+    camera.set_shutter_open(shutter_open)
+    camera.set_shutter_close(shutter_close)
 
-    settings = wr.RenderSettings()
+    settings = recipe.settings
     settings.set_resolution(512, 512)
     settings.set_remote_folder('/MyRenders/turntable')
+    # Render with 3D motion blur.
+    settings.set_motion_blur(True)
 
     area_light = scene.new_light(wr.lights.Area)
     area_light.set_intensity(500.0)
-    area_light.set_xform(wr.Transform(
+    area_light.set_xform(sr.Transform(
         translate=(11.0, 12.0, 8.0),
         rotate=(-24.0, 50.0, 0.0),
         scale=(4.0, 4.0, 4.0)))
@@ -114,49 +135,44 @@ def turntable_async(session):
     env_light = scene.new_light(wr.lights.Envsky)
     env_light.set_intensity(0.3)
 
-    requests = []
     num_frames = 12
 
-    # Model transformation.
-    xform1 = wr.Transform(translate=(-7.0, 0.0, 0.0))
-    xform2 = wr.Transform(translate=(7.0, 0.0, 0.0))
-
-    # Set different transformations at time 0 and 11.
-    maneki.set_xform_at(xform1, 0.0)
-    maneki.set_xform_at(xform1, 1.0) # no motion blur on first frame
-    maneki.set_xform_at(xform2, 10.0)
-    maneki.set_xform_at(xform2, 11.0) # no motion blur on last frame
-
+    # Model keyframes: hold still on the first and last frames (no motion
+    # blur), move linearly in between.
+    curves = AnimCurves()
+    curves.add('maneki', [0.0, 1.0, 10.0, 11.0],
+               translate=[(-7.0, 0.0, 0.0), (-7.0, 0.0, 0.0),
+                          (7.0, 0.0, 0.0), (7.0, 0.0, 0.0)])
+    # Key the samples the shutter of each frame needs.
+    curves.apply({'maneki': maneki}, range(num_frames),
+                 shutter_open, shutter_close)
+
+    # Each frame only sets the current frame and its image name.
+    sequence = FrameSequence(recipe)
     for frame in range(num_frames):
-        # Set the current frame.
-        settings.set_frame(frame)
-        # Render with 3D motion blur.
-        settings.set_motion_blur(True)
+        sequence.add(frame, 'animation_async_{:02d}.png'.format(frame))
 
-        settings.set_image_name('animation_async_{:02d}.png'.format(frame))
-        requests.append(session.start_render(settings, scene))
+    assets = {'maneki.usdz': maneki_asset, 'plane.usd': plane_asset}
+    requests = sequence.submit(session, assets)
 
     wait_for_all_renders(session, requests)
 
 
 def wait_for_all_renders(session, requests):
-    # 1. Wait until all the renders have finished.
-    statuses = [session.query_render(request) for request in requests]
-    while not all([status.done for status in statuses]):
-        print('waiting for renders...')
-        time.sleep(1)
-        statuses = [session.query_render(request) for request in requests]
-
-    # 2. Download all the images.
-    for i, status in enumerate(statuses):
+    # Download each image as soon as its render has finished, while the other
+    # renders are still running. Only the pending renders are queried.
+    def download(i, status):
         if status.failed:
             print('render {} failed!'.format(i))
         else:
             status.get_result().download_image(tempfile.gettempdir())
 
+    print('waiting for renders...')
+    process_as_completed(session, requests, download)
+
 
 if __name__ == "__main__":
-    session = wr.authenticate()
+    session = CachedSession(wr.authenticate())
 
     # Un-comment / comment the following call to choose whether to render serial
     # or async
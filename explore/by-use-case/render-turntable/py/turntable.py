@@ -3,11 +3,22 @@
 #   by use-case: render turntable
 
 import os
+import sys
 import tempfile
-import time
 
 import werender as wr
 
+# helpers shared by the explore examples live in explore/common/py
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'common', 'py'))
+import scene_recipe as sr
+from frame_sequence import FrameSequence
+from job_journal import JobJournal
+from preview_first import PreviewFirst
+from render_cache import asset_digests
+from render_queue import process_as_completed
+from upload_cache import CachedSession
+
 
 def resolve_file(filename):
     return os.path.join(
@@ -62,7 +73,7 @@ def turntable_serial(session):
         result.download_image(tempfile.gettempdir())
 
 
-def turntable_async(session):
+def turntable_async(session, preview_step=0, resume=False):
     """Creates a turn-table sequence by rotating a light around the model.
 
     The images are generated _in parallel_ on the cloud by submitting each
@@ -70,72 +81,106 @@ def turntable_async(session):
     render job on the cloud and returns immediately an object of type
     `RenderRequest`. Such object can be used to query the status of the render
     and finally obtain and download the rendered image.
+
+    The scene is described once, each frame only adds its delta: the frame
+    number, the image name and the rotation applied to the light.
+
+    With a `preview_step` (e.g. 4), every `preview_step`-th frame is first
+    rendered as a small, noisy preview, then the other previews and finally
+    the full quality frames. The previews land in `turntable_preview` in the
+    temporary folder as they finish, ready to be scrubbed. They are extra
+    render jobs, hence off by default.
+
+    Every frame submitted is recorded in the local job journal: if the run
+    is interrupted, `resume=True` reuses the frames already rendered, waits
+    for the ones still in flight and submits the others again (without
+    previews).
     """
     maneki_asset = session.upload(resolve_file('maneki.usdz'), '/assets')
     plane_asset = session.upload(resolve_file('plane.usd'), '/assets')
 
-    scene = wr.Scene()
+    recipe = sr.SceneRecipe()
+    scene = recipe.scene
 
-    maneki = scene.new_model(maneki_asset)
-    plane = scene.new_model(plane_asset)
+    maneki = scene.new_model(recipe.asset('maneki.usdz'))
+    plane = scene.new_model(recipe.asset('plane.usd'))
 
     camera = scene.new_camera(wr.cameras.Persp)
     camera.set_focal_length(45.0)
-    camera_xform = wr.Transform(
+    camera_xform = sr.Transform(
         translate=(0.0, 23.0, 32.0),
         rotate=(-25.0, 0.0, 0.0))
     camera.set_xform(camera_xform)
 
-    settings = wr.RenderSettings()
+    settings = recipe.settings
     settings.set_resolution(512, 512)
     settings.set_remote_folder('/MyRenders/turntable')
 
-    area_light = scene.new_light(wr.lights.Area)
+    area_light = recipe.name('area_light', scene.new_light(wr.lights.Area))
     area_light.set_intensity(500.0)
-    area_light.set_xform(wr.Transform(
+    area_light_xform = sr.Transform(
         translate=(11.0, 12.0, 8.0),
         rotate=(-24.0, 50.0, 0.0),
-        scale=(4.0, 4.0, 4.0)))
+        scale=(4.0, 4.0, 4.0))
+    area_light.set_xform(area_light_xform)
 
     env_light = scene.new_light(wr.lights.Envsky)
     env_light.set_intensity(0.3)
 
-    requests = []
     num_frames = 12
-    turntable_xform = wr.Transform()
+    sequence = FrameSequence(recipe)
 
     for frame in range(num_frames):
-        turntable_xform.set_rotation(0.0, 360.0 / num_frames * frame, 0.0)
-        area_light.set_xform(area_light_xform)
-        area_light.apply_xform(turntable_xform)
-
-        settings.set_image_name('turntable_async_{:02d}.png'.format(frame))
-        requests.append(session.start_render(settings, scene))
-
-    wait_for_all_renders(session, requests)
-
-
-def wait_for_all_renders(session, requests):
-    # 1. Wait until all the renders have finished.
-    statuses = [session.query_render(request) for request in requests]
-    while not all([status.done for status in statuses]):
-        print('waiting for renders...')
-        time.sleep(1)
-        statuses = [session.query_render(request) for request in requests]
-
-    # 2. Download all the images.
-    for i, status in enumerate(statuses):
+        turntable_xform = sr.Transform(
+            rotate=(0.0, 360.0 / num_frames * frame, 0.0))
+        sequence.add(frame, 'turntable_async_{:02d}.png'.format(frame),
+                     {'area_light.apply_xform': turntable_xform})
+
+    assets = {'maneki.usdz': maneki_asset, 'plane.usd': plane_asset}
+    # frames are journaled by scene and asset contents, so that a frame of
+    # an asset edited since is rendered again when resuming
+    asset_keys = asset_digests(session, assets, resolve_file)
+    journal = JobJournal(resume=resume)
+    if not preview_step or resume:
+        requests = sequence.submit(session, assets, asset_keys=asset_keys,
+                                   journal=journal)
+        print(journal.report())
+        wait_for_all_renders(session, requests, journal)
+        return
+
+    preview = PreviewFirst(sequence, step=preview_step)
+    previews, requests = preview.submit(session, assets,
+                                        asset_keys=asset_keys,
+                                        journal=journal)
+    streamer = preview.stream(session, previews, os.path.join(
+        tempfile.gettempdir(), 'turntable_preview'))
+
+    wait_for_all_renders(session, requests, journal)
+    streamer.join()
+
+
+def wait_for_all_renders(session, requests, journal=None):
+    # Download each image as soon as its render has finished, while the other
+    # renders are still running. Only the pending renders are queried.
+    def download(i, status):
         if status.failed:
             print('render {} failed!'.format(i))
         else:
             status.get_result().download_image(tempfile.gettempdir())
+        if journal is not None:
+            journal.complete(requests[i], status)
+
+    print('waiting for renders...')
+    process_as_completed(session, requests, download)
 
 
 if __name__ == "__main__":
-    session = wr.authenticate()
+    session = CachedSession(wr.authenticate())
 
     # Un-comment / comment the following call to choose whether to render serial
     # or async
 
     #turntable_serial(session)
-    turntable_async(session)
+
+    # run with --resume to pick up an interrupted run where it stopped
+    turntable_async(session, resume='--resume' in sys.argv)
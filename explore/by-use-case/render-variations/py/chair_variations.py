@@ -4,10 +4,20 @@
 import os
 import sys
 import tempfile
-import time
 
 import werender as wr
 
+# helpers shared by the explore examples live in explore/common/py
+sys.path.append(os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), '..', '..', '..', 'common', 'py'))
+import scene_recipe as sr
+from job_journal import JobJournal
+from render_cache import RenderCache, asset_digests
+from sweep import Sweep, load_spec, run_sweep
+from texture_prep import prepare_textures
+from upload_cache import CachedSession
+from upload_plan import UploadPlan
+
 
 def resolve_file(filename):
     '''
@@ -17,58 +27,37 @@ def resolve_file(filename):
         os.environ.get('WERENDER_ASSETS_PATH', './'), filename)
 
 
-def create_render(session,
-                  asset_name,
-                  cam_name,
-                  cam_xform,
-                  mat_name,
-                  mat_value):
+def create_template():
     '''
-    create render asynchronously
+    create the scene shared by all the variations: the chair asset, the
+    camera transform and the seat color are left to each variation
     '''
-    # log file
-    wr.set_log_file(os.path.join(
-        tempfile.gettempdir(), 'chair_variations.log'))
-
-    # where to store assets in the cloud storage
-    remote_folder = '/assets/examples'
-
-    # assets
-    chair_asset = session.upload(resolve_file(
-        asset_name + '.usd'), remote_folder)
-    backdrop_asset = session.upload(
-        resolve_file('backdrop_4.usd'), remote_folder)
-    hdri_asset = session.upload(resolve_file('studio_03.exr'), remote_folder)
-    wood_tex_asset = session.upload(
-        resolve_file('wood_col.jpg'), remote_folder)
-
-    # create scene
-    scene = wr.Scene()
+    recipe = sr.SceneRecipe()
+    scene = recipe.scene
 
-    # create models
-    chair = scene.new_model(chair_asset)
-    backdrop = scene.new_model(backdrop_asset)
+    # create models, the chair asset is chosen by each variation
+    chair = recipe.name('chair', scene.new_model(recipe.asset('chair')))
+    backdrop = scene.new_model(recipe.asset('backdrop_4.usd'))
 
     # create & apply transforms to chair
-    chair_xform = wr.Transform(rotate=(0.0, 103.751, 0.0))
+    chair_xform = sr.Transform(rotate=(0.0, 103.751, 0.0))
     chair.set_xform(chair_xform)
 
-    # create camera, create and apply transform, set attribute
-    camera = scene.new_camera(wr.cameras.Persp)
-    camera.set_xform(cam_xform)
+    # create camera and set attribute, its transform is set by each variation
+    camera = recipe.name('camera', scene.new_camera(wr.cameras.Persp))
     camera.set_focal_length(90.0)
 
     # create hdri texture, env light and its properties
     tex_hdri = scene.new_texture(wr.textures.File)
-    tex_hdri.set_texture_file(hdri_asset)
+    tex_hdri.set_texture_file(recipe.asset('studio_03.exr'))
     envlight = scene.new_light(wr.lights.Envhdri)
     envlight.set_hdri_image(tex_hdri)
     envlight.set_intensity(1.0)
-    envlight_xform = wr.Transform(rotate=(0.0, 66.947, 0.0))
+    envlight_xform = sr.Transform(rotate=(0.0, 66.947, 0.0))
     envlight.set_xform(envlight_xform)
 
     # create materials
-    mat_seat = scene.new_material(wr.materials.Generic)
+    mat_seat = recipe.name('mat_seat', scene.new_material(wr.materials.Generic))
     mat_legs_steel = scene.new_material(wr.materials.Metal)
     mat_legs_wood = scene.new_material(wr.materials.Generic)
     mat_screws = scene.new_material(wr.materials.Metal)
@@ -77,19 +66,19 @@ def create_render(session,
     mat_backdrop = scene.new_material(wr.materials.Generic)
 
     # set material attributes
-    mat_legs_steel.set_color(wr.Color(1.0, 1.0, 1.0))
-    mat_legs_steel.set_edge_color(wr.Color(1.0, 1.0, 1.0))
+    mat_legs_steel.set_color(sr.Color(1.0, 1.0, 1.0))
+    mat_legs_steel.set_edge_color(sr.Color(1.0, 1.0, 1.0))
     mat_legs_steel.set_roughness(0.2)
 
-    mat_frame.set_color(wr.Color(0.1, 0.1, 0.1))
-    mat_frame.set_edge_color(wr.Color(1.0, 1.0, 1.0))
+    mat_frame.set_color(sr.Color(0.1, 0.1, 0.1))
+    mat_frame.set_edge_color(sr.Color(1.0, 1.0, 1.0))
     mat_frame.set_roughness(0.7)
 
-    mat_screws.set_color(wr.Color(0.154, 0.139, 0.131))
-    mat_screws.set_edge_color(wr.Color(0.78, 0.78, 0.78))
+    mat_screws.set_color(sr.Color(0.154, 0.139, 0.131))
+    mat_screws.set_edge_color(sr.Color(0.78, 0.78, 0.78))
     mat_screws.set_roughness(0.2)
 
-    mat_stoppers.set_color(wr.Color(0.1, 0.1, 0.1))
+    mat_stoppers.set_color(sr.Color(0.1, 0.1, 0.1))
     mat_stoppers.set_specular_level(1.0)
     mat_stoppers.set_roughness(0.623)
 
@@ -99,11 +88,11 @@ def create_render(session,
     seat_hgt_tex.set_noise_type(3)
     seat_hgt_tex.set_invert(1)
     # since we invert we should set it to black to obtain white
-    seat_hgt_tex.set_border_color(wr.Color(0.0, 0.0, 0.0))
-    #seat_hgt_tex.set_background_color(wr.Color(0.0, 0.0, 0.0)) # to be added
+    seat_hgt_tex.set_border_color(sr.Color(0.0, 0.0, 0.0))
+    #seat_hgt_tex.set_background_color(sr.Color(0.0, 0.0, 0.0)) # to be added
 
-    # create material for seat and set attributes: it uses the above texture
-    mat_seat.set_color(mat_value)
+    # create material for seat and set attributes: it uses the above texture,
+    # its color is set by each variation
     mat_seat.set_height(seat_hgt_tex)
     mat_seat.set_height_amount(0.5)
     mat_seat.set_height_type(3)
@@ -111,7 +100,7 @@ def create_render(session,
 
     # create legs texture and its attributes
     wood_tex_col = scene.new_texture(wr.textures.File)
-    wood_tex_col.set_texture_file(wood_tex_asset)
+    wood_tex_col.set_texture_file(recipe.asset('wood_col.jpg'))
 
     # create material for seat and set attributes: it uses the above texture
     mat_legs_wood.set_color(wood_tex_col)
@@ -127,78 +116,111 @@ def create_render(session,
     chair.assign_material(mat_stoppers, '.*/stoppers.*')
     chair.assign_material(mat_frame, '.*/frame.*')
 
-    mat_backdrop.set_color(wr.Color(1.0, 1.0, 1.0))
+    mat_backdrop.set_color(sr.Color(1.0, 1.0, 1.0))
     mat_backdrop.set_specular_level(1.0)
     mat_backdrop.set_roughness(0.2)
 
     backdrop.assign_material(mat_backdrop)
 
-    # create render settings
-    image_name = asset_name + '_' + cam_name + '_' + mat_name + '.png'
-
-    settings = wr.RenderSettings()
+    # create render settings, the image name is set by each variation
+    settings = recipe.settings
     settings.set_resolution(1000, 1000)
-    settings.set_image_name(image_name)
 
     # specify where renders will be stored in the cloud storage
     settings.set_remote_folder('/MyRenders/examples')
 
-    # render asynchronously
-    request = session.start_render(settings, scene)
-    return request
+    return recipe
+
+
+# the variations: every combination of chair asset, camera transform and
+# seat color, each axis overriding one call of the shared scene. The same
+# spec can be given as a JSON or YAML file, see `sweep.py`.
+CHAIR_SWEEP = {
+    'image_name': '{chair}_{camera}_{seat}.png',
+    'axes': [
+        {'name': 'chair', 'key': 'chair',
+         'values': {'chair_dsr': 'chair_dsr.usd',
+                    'chair_dsw': 'chair_dsw.usd',
+                    'chair_dsx': 'chair_dsx.usd'}},
+        {'name': 'camera', 'key': 'camera.set_xform', 'type': 'transform',
+         'values': {
+             'wide': {'translate': [1560.608, 828.903, 2184.463],
+                      'rotate': [-9.938, 35.800, 0.0]},
+             'near': {'translate': [521.161, 292.448, 412.655],
+                      'rotate': [12.262, 47.0, 0.0]}}},
+        {'name': 'seat', 'key': 'mat_seat.set_color', 'type': 'color',
+         'values': {'yellow': [0.710, 0.607, 0.0],
+                    'green': [0.0, 0.710, 0.607]}}]}
+
+
+def main(session, texture_proxies=False, prepare_hdri=False, spec_file=None,
+         max_in_flight=16, resume=False):
+    # log file
+    wr.set_log_file(os.path.join(
+        tempfile.gettempdir(), 'chair_variations.log'))
 
+    # the variations are generated one at a time as renders are submitted,
+    # so a sweep of thousands of them is never held in memory
+    sweep = Sweep(load_spec(spec_file) if spec_file else CHAIR_SWEEP)
+    print('{} variations'.format(len(sweep)))
 
-def wait_for_all_renders(session, requests, request_features):
-    # 1. Wait until all the renders have finished.
-    statuses = [session.query_render(request) for request in requests]
-    while not all([status.done for status in statuses]):
-        print('waiting for renders...')
-        time.sleep(1)
-        statuses = [session.query_render(request) for request in requests]
+    # where to store assets in the cloud storage
+    remote_folder = '/assets/examples'
 
-    # 2. Download all the images.
-    for i, status in enumerate(statuses):
+    # collect the assets of every variation: the plan uploads each unique
+    # file once, concurrently, before building any scene
+    template = create_template()
+    resolve = resolve_file
+    if texture_proxies:
+        # textures downscaled for the render resolution
+        resolve = prepare_textures(template, resolve_file)
+    if prepare_hdri:
+        # half-float hdri (needs numpy and OpenEXR)
+        from hdri_prep import prepare_hdris
+        resolve = prepare_hdris(template, resolve)
+    plan = UploadPlan()
+    slots = [axis.key for axis in sweep.axes if '.' not in axis.key]
+    shared = [name for name in template.asset_names() if name not in slots]
+    for labels, overrides in sweep:
+        for filename in [overrides[slot] for slot in slots] + shared:
+            plan.add(resolve(filename), remote_folder, filename)
+    assets = plan.execute(session)
+    print(plan.report())
+
+    # the variations already rendered with the same scene and asset contents
+    # are reused from the cloud storage instead of being submitted
+    cache = RenderCache()
+    asset_keys = asset_digests(session, assets, resolve)
+
+    # every submitted render is recorded in the local job journal: after a
+    # crash or a Ctrl-C, `resume=True` reuses the renders that finished,
+    # waits for the ones still in flight and submits the others again
+    journal = JobJournal(resume=resume)
+
+    # Download each image as soon as its render has finished, while the other
+    # renders are still running
+    def download(labels, request, status):
+        if request is None:
+            print('render {} not submitted: {}'.format(labels, status))
+            return
+        journal.complete(request, status)
         if status.failed:
-            print('render {} failed!'.format(i))
-        else:
-            (asset_name, cam_name, mat_name) = request_features[i]
-            image_name = asset_name + '_' + cam_name + '_' + mat_name + '.png'
-            status.get_result().download_image(tempfile.gettempdir(),
-                                               image_name)
-
-
-def main(session):
-
-    # array of strings for the asset filenames
-    chair_assets = ['chair_dsr', 'chair_dsw', 'chair_dsx']
-
-    # dictionary of camera transforms
-    cam_dict = {
-        "wide": wr.Transform(translate=(1560.608, 828.903, 2184.463),
-                             rotate=(-9.938, 35.800, 0.0)),
-        "near": wr.Transform(translate=(521.161, 292.448, 412.655),
-                             rotate=(12.262, 47.0, 0.0))}
-
-    # dictionary of camera transforms
-    mat_dict = {
-        "yellow": wr.Color(0.710, 0.607, 0.0),
-        "green": wr.Color(0.0, 0.710, 0.607)}
-
-    # create render jobs with different assets and cameras
-    requests = list()
-    request_features = list()
-    for asset in chair_assets:
-        for (cam_name, cam_xform) in cam_dict.items():
-            for (mat_name, mat_value) in mat_dict.items():
-                request = create_render(
-                    session, asset, cam_name, cam_xform, mat_name, mat_value)
-                requests.append(request)
-                request_features.append((asset, cam_name, mat_name))
-
-    # wait for all jobs
-    wait_for_all_renders(session, requests, request_features)
+            print('render {} failed!'.format(labels))
+            return
+        image_name = sweep.image_name.format(**labels)
+        status.get_result().download_image(tempfile.gettempdir(), image_name)
+        # remember the render, so that it is reused by the next run
+        cache.complete(request, status)
+
+    # submit the variations with at most `max_in_flight` renders pending
+    print('waiting for renders...')
+    run_sweep(session, template, sweep, assets, download, max_in_flight,
+              cache=cache, asset_keys=asset_keys, journal=journal)
+    print(cache.report())
+    print(journal.report())
 
 
 if __name__ == '__main__':
-    session = wr.authenticate()
-    main(session)
+    session = CachedSession(wr.authenticate())
+    # run with --resume to pick up an interrupted run where it stopped
+    main(session, resume='--resume' in sys.argv)
@@ -0,0 +1,267 @@
+# Copyright 2022 J-CUBE Inc. Yokohama, Japan. All Rights Reserved.
+# https://werender.io
+#   common: keyframed transforms evaluated with numpy
+
+import numpy as np
+
+from scene_recipe import Transform
+
+INTERPOLATIONS = ('linear', 'bezier', 'slerp')
+
+
+def euler_to_quat(rotate):
+    """Converts XYZ euler angles in degrees (..., 3) to quaternions (..., 4).
+
+    Quaternions are stored as (w, x, y, z), the X rotation is applied first.
+    """
+    half = np.radians(np.asarray(rotate, dtype=np.float64)) * 0.5
+    c = np.cos(half)
+    s = np.sin(half)
+    cx, cy, cz = c[..., 0], c[..., 1], c[..., 2]
+    sx, sy, sz = s[..., 0], s[..., 1], s[..., 2]
+    return np.stack([
+        cx * cy * cz + sx * sy * sz,
+        sx * cy * cz - cx * sy * sz,
+        cx * sy * cz + sx * cy * sz,
+        cx * cy * sz - sx * sy * cz], axis=-1)
+
+
+def quat_to_euler(quat):
+    """Converts quaternions (..., 4) back to XYZ euler angles in degrees."""
+    w, x, y, z = quat[..., 0], quat[..., 1], quat[..., 2], quat[..., 3]
+    rx = np.arctan2(2.0 * (w * x + y * z), 1.0 - 2.0 * (x * x + y * y))
+    ry = np.arcsin(np.clip(2.0 * (w * y - z * x), -1.0, 1.0))
+    rz = np.arctan2(2.0 * (w * z + x * y), 1.0 - 2.0 * (y * y + z * z))
+    return np.degrees(np.stack([rx, ry, rz], axis=-1))
+
+
+def unwrap_euler(rotate, reference):
+    """Picks, for each euler triple, the equivalent form closest to the last.
+
+    `rotate` is (..., samples, 3) in degrees, `reference` (..., 3) what the
+    first sample is brought close to. Every XYZ rotation has two forms,
+    (x, y, z) and (x + 180, 180 - y, z + 180), each up to turns of 360
+    degrees; converting samples one by one can jump between them, which
+    makes the euler interpolation of the renderer spin the object.
+    """
+    rotate = np.array(rotate, dtype=np.float64)
+    previous = np.asarray(reference, dtype=np.float64)
+    flip = np.array([180.0, 180.0, 180.0])
+    sign = np.array([1.0, -1.0, 1.0])
+    for j in range(rotate.shape[-2]):
+        best = None
+        for candidate in (rotate[..., j, :], flip + sign * rotate[..., j, :]):
+            candidate = candidate + 360.0 * np.round(
+                (previous - candidate) / 360.0)
+            distance = np.abs(candidate - previous).sum(-1, keepdims=True)
+            if best is None:
+                best, best_distance = candidate, distance
+            else:
+                best = np.where(distance < best_distance, candidate, best)
+        rotate[..., j, :] = previous = best
+    return rotate
+
+
+def _lerp(v0, v1, u):
+    return v0 + (v1 - v0) * u[..., None]
+
+
+def _bezier(v0, v1, m0, m1, dt, u):
+    # cubic bezier through v0, v1 with control points along the tangents
+    c0 = v0 + m0 * (dt / 3.0)[..., None]
+    c1 = v1 - m1 * (dt / 3.0)[..., None]
+    u = u[..., None]
+    w = 1.0 - u
+    return w * w * w * v0 + 3.0 * w * w * u * c0 + 3.0 * w * u * u * c1 + \
+        u * u * u * v1
+
+
+def _slerp(q0, q1, u):
+    dot = np.sum(q0 * q1, axis=-1)
+    # take the shortest path
+    q1 = np.where((dot < 0.0)[..., None], -q1, q1)
+    dot = np.abs(dot)
+    theta = np.arccos(np.clip(dot, -1.0, 1.0))
+    sin_theta = np.sin(theta)
+    # fall back to a normalized lerp for nearly equal rotations
+    close = sin_theta < 1e-6
+    safe = np.where(close, 1.0, sin_theta)
+    w0 = np.where(close, 1.0 - u, np.sin((1.0 - u) * theta) / safe)
+    w1 = np.where(close, u, np.sin(u * theta) / safe)
+    q = w0[..., None] * q0 + w1[..., None] * q1
+    return q / np.linalg.norm(q, axis=-1, keepdims=True)
+
+
+def _tangents(times, values):
+    """Returns per-key slopes (finite differences, one-sided at the ends)."""
+    prev_t = np.concatenate([times[:, :1], times[:, :-1]], axis=1)
+    next_t = np.concatenate([times[:, 1:], times[:, -1:]], axis=1)
+    prev_v = np.concatenate([values[:, :1], values[:, :-1]], axis=1)
+    next_v = np.concatenate([values[:, 1:], values[:, -1:]], axis=1)
+    dt = next_t - prev_t
+    safe = np.where(dt > 0.0, dt, 1.0)
+    return np.where((dt > 0.0)[..., None], (next_v - prev_v) / safe[..., None],
+                    0.0)
+
+
+class AnimCurves(object):
+    """Keyframed transforms of many objects, evaluated in one numpy pass.
+
+    Each object has its own key times and translate / rotate (XYZ euler, in
+    degrees) / scale values, plus an interpolation:
+
+    - 'linear': every channel is interpolated linearly,
+    - 'bezier': smooth cubic curves with automatic tangents,
+    - 'slerp': linear translate and scale, spherical rotations; keys must
+      then be less than 180 degrees apart.
+
+    Outside their keys objects hold their first / last value.
+
+        curves = AnimCurves()
+        curves.add('maneki', [0.0, 11.0],
+                   translate=[(-7.0, 0.0, 0.0), (7.0, 0.0, 0.0)])
+        curves.apply({'maneki': maneki}, range(12), -0.5, 0.5)
+    """
+
+    def __init__(self):
+        self.names = []
+        self._keys = []
+
+    def add(self, name, times, translate=None, rotate=None, scale=None,
+            interpolation='linear'):
+        if interpolation not in INTERPOLATIONS:
+            raise ValueError('unknown interpolation: {}'.format(interpolation))
+        times = np.asarray(times, dtype=np.float64)
+        count = len(times)
+        if count == 0 or np.any(np.diff(times) < 0.0):
+            raise ValueError('key times must be sorted and not empty')
+
+        def channel(values, default):
+            if values is None:
+                return np.tile(default, (count, 1))
+            values = np.asarray(values, dtype=np.float64).reshape(count, 3)
+            return values
+
+        self.names.append(name)
+        self._keys.append((times, channel(translate, (0.0, 0.0, 0.0)),
+                           channel(rotate, (0.0, 0.0, 0.0)),
+                           channel(scale, (1.0, 1.0, 1.0)), interpolation))
+
+    def _packed(self, indices):
+        # pad every object to the same number of keys by repeating its last
+        # key: the padded segments have zero length and are never entered
+        size = max(len(self._keys[i][0]) for i in indices)
+
+        def pad(array):
+            extra = size - len(array)
+            if extra == 0:
+                return array
+            return np.concatenate([array, np.repeat(array[-1:], extra, 0)])
+
+        times = np.stack([pad(self._keys[i][0]) for i in indices])
+        channels = [np.stack([pad(self._keys[i][c]) for i in indices])
+                    for c in (1, 2, 3)]
+        return times, channels
+
+    def evaluate(self, times):
+        """Samples every object at `times`.
+
+        Returns translate, rotate and scale arrays of shape
+        (objects, len(times), 3), objects in the order they were added.
+        """
+        t = np.asarray(times, dtype=np.float64)
+        result = [np.empty((len(self.names), len(t), 3)) for _ in range(3)]
+        for interpolation in INTERPOLATIONS:
+            indices = [i for i, keys in enumerate(self._keys)
+                       if keys[4] == interpolation]
+            if not indices:
+                continue
+            key_times, channels = self._packed(indices)
+            size = key_times.shape[1]
+            if size == 1:
+                for c in range(3):
+                    result[c][indices] = channels[c][:, :1, :]
+                continue
+
+            # segment index and local parameter of every (object, time) pair
+            segment = np.clip(
+                (key_times[:, None, :] <= t[None, :, None]).sum(-1) - 1,
+                0, size - 2)
+            t0 = np.take_along_axis(key_times, segment, 1)
+            t1 = np.take_along_axis(key_times, segment + 1, 1)
+            dt = t1 - t0
+            u = np.clip((t[None, :] - t0) / np.where(dt > 0.0, dt, 1.0),
+                        0.0, 1.0)
+
+            def at(values, offset):
+                index = (segment + offset)[..., None].repeat(3, -1)
+                return np.take_along_axis(values, index, 1)
+
+            for c, values in enumerate(channels):
+                v0, v1 = at(values, 0), at(values, 1)
+                if interpolation == 'bezier':
+                    slopes = _tangents(key_times, values)
+                    sampled = _bezier(v0, v1, at(slopes, 0), at(slopes, 1),
+                                      dt, u)
+                elif interpolation == 'slerp' and c == 1:
+                    quats = euler_to_quat(values)
+                    index = segment[..., None].repeat(4, -1)
+                    q0 = np.take_along_axis(quats, index, 1)
+                    q1 = np.take_along_axis(quats, index + 1, 1)
+                    sampled = unwrap_euler(quat_to_euler(
+                        _slerp(q0, q1, u)), values[:, 0])
+                else:
+                    sampled = _lerp(v0, v1, u)
+                result[c][indices] = sampled
+        return tuple(result)
+
+    @staticmethod
+    def shutter_times(frames, shutter_open, shutter_close, steps=2):
+        """Returns the sorted, unique times the shutter of `frames` spans.
+
+        Each frame is sampled `steps` times from `frame + shutter_open` to
+        `frame + shutter_close`; shared instants are emitted once.
+        """
+        frames = np.asarray(list(frames), dtype=np.float64)
+        offsets = np.linspace(shutter_open, shutter_close, max(steps, 1))
+        return np.unique(np.round(frames[:, None] + offsets[None, :], 9))
+
+    def apply(self, nodes, frames, shutter_open=0.0, shutter_close=0.0,
+              steps=2, make_xform=Transform):
+        """Keys `node.set_xform_at()` on the times the frames' shutters need.
+
+        Those are the `shutter_times()` plus the keys of each object falling
+        inside a shutter interval, so the animation still goes through its
+        keyframes. `nodes` maps object names to scene models (or recipe
+        nodes), objects without a node are skipped. Use
+        `make_xform=wr.Transform` when keying `werender` models directly.
+        Returns the number of keys set.
+        """
+        frames = np.asarray(list(frames), dtype=np.float64)
+        shutter = self.shutter_times(frames, shutter_open, shutter_close,
+                                     steps)
+        low = frames + min(shutter_open, shutter_close)
+        high = frames + max(shutter_open, shutter_close)
+
+        def inside(key_times):
+            return key_times[((key_times[:, None] >= low[None, :] - 1e-9) &
+                              (key_times[:, None] <= high[None, :] + 1e-9)
+                              ).any(axis=1)]
+
+        keyed = [inside(keys[0]) for keys in self._keys]
+        times = np.unique(np.round(np.concatenate([shutter] + keyed), 9))
+        translate, rotate, scale = self.evaluate(times)
+        count = 0
+        for i, name in enumerate(self.names):
+            node = nodes.get(name)
+            if node is None:
+                continue
+            own = np.isin(times, np.round(np.concatenate([shutter, keyed[i]]),
+                                          9))
+            for j in np.flatnonzero(own).tolist():
+                node.set_xform_at(make_xform(
+                    translate=tuple(translate[i, j].tolist()),
+                    rotate=tuple(rotate[i, j].tolist()),
+                    scale=tuple(scale[i, j].tolist())), times[j].item())
+                count += 1
+        return count
@@ -0,0 +1,87 @@
+# Copyright 2022 J-CUBE Inc. Yokohama, Japan. All Rights Reserved.
+# https://werender.io
+#   common: submitting variants of a shared base scene
+
+from concurrent.futures import ThreadPoolExecutor
+
+
+def apply_overrides(base, overrides):
+    """Returns a clone of the recipe `base` with `overrides` applied.
+
+    `overrides` maps 'node.method' to the argument (or tuple of arguments) of
+    the call to record on the clone, where `node` is a name given with
+    `base.name()`, or 'scene' / 'settings'. A key without a dot rebinds an
+    asset slot instead: {'chair': 'chair_dsr.usd'} makes
+    `base.asset('chair')` resolve to the uploaded 'chair_dsr.usd'.
+
+    Returns the clone and its asset slots.
+    """
+    variant = base.clone()
+    slots = {}
+    for key, args in overrides.items():
+        if '.' not in key:
+            slots[key] = args
+            continue
+        name, method = key.rsplit('.', 1)
+        if name == 'scene':
+            node = variant.scene
+        elif name == 'settings':
+            node = variant.settings
+        else:
+            node = variant[name]
+        if not isinstance(args, tuple):
+            args = (args,)
+        getattr(node, method)(*args)
+    return variant, slots
+
+
+def submit_variant(session, base, overrides, assets, cache=None,
+                   asset_keys=None, journal=None, live=None):
+    """Builds the variant of `base` described by `overrides` and submits it.
+
+    `assets` maps the names used in the recipe to uploaded assets. With a
+    `render_cache.RenderCache`, a variant rendered before is not submitted
+    again; `asset_keys` then maps asset names to their content digests.
+    With a `job_journal.JobJournal`, the submission is journaled (and
+    resumed). With a `scene_recipe.LiveScene` of `base`, only the overrides
+    are applied to its scene instead of building the whole variant (one
+    variant at a time). Returns the render request (or the cached render).
+    """
+    variant, slots = apply_overrides(base, overrides)
+    if live is not None and slots:
+        raise ValueError('asset slots cannot be rebound on a live scene')
+    variant_assets = dict(assets)
+    variant_keys = dict(asset_keys or {})
+    for slot, name in slots.items():
+        variant_assets[slot] = assets[name]
+        variant_keys[slot] = variant_keys.get(name, name)
+    if journal is not None:
+        return journal.submit(session, variant, variant_assets, variant_keys,
+                              cache, live)
+    if cache is not None:
+        return cache.submit(session, variant, variant_assets, variant_keys,
+                            live)
+    if live is not None:
+        scene, settings = live.build(variant)
+        return session.start_render(settings, scene)
+    scene, settings = variant.build(variant_assets)
+    return session.start_render(settings, scene)
+
+
+def submit_batch(session, base, variants, assets, max_workers=8, cache=None,
+                 asset_keys=None, journal=None):
+    """Submits one render per override set in `variants`.
+
+    Each variant is a copy-on-write clone of `base` (see `apply_overrides()`)
+    built and submitted on a pool of `max_workers` threads, so the base is
+    recorded once and the requests are sent concurrently. `assets` maps the
+    names used in the recipes to uploaded assets, `cache`, `asset_keys` and
+    `journal` are passed to `submit_variant()`. Returns the render requests in the
+    order of `variants`.
+    """
+    def submit(overrides):
+        return submit_variant(session, base, overrides, assets, cache,
+                              asset_keys, journal)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(submit, variants))
@@ -0,0 +1,191 @@
+# Copyright 2022 J-CUBE Inc. Yokohama, Japan. All Rights Reserved.
+# https://werender.io
+#   common: benchmark of the binary recipe encoding
+#
+# Captures the scene of every render of every example (run offline against
+# a mock session) plus a synthetic scene of 100k material assignments, and
+# compares the size and encode / decode times of `recipe_codec` with JSON:
+#   python bench_codec.py
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import time
+
+import werender as wr
+
+import frame_sequence
+import recipe_codec
+import scene_recipe as sr
+from mock_session import (MockSession, example_files, load_example,
+                          scratch_caches)
+from render_cache import recipe_hash
+
+ENTRIES = ('main', 'turntable_serial', 'turntable_async', 'render_frames')
+
+
+def snapshot(scene, settings):
+    """Returns a recipe holding the current state of a captured render."""
+    recipe = sr.SceneRecipe()
+    recipe.ops = list(scene.recipe.ops)
+    recipe.names = dict(scene.recipe.names)
+    recipe._count = scene.recipe._count
+    if settings.recipe is not scene.recipe:
+        recipe.ops += settings.recipe.ops
+    return recipe
+
+
+class CaptureSession(MockSession):
+    """A mock session keeping a recipe of the scene of every render."""
+
+    def __init__(self):
+        MockSession.__init__(self, latency=0.0, render_time=(0.0, 0.0))
+        self.recipes = []
+
+    def upload(self, filename, remote_folder):
+        MockSession.upload(self, filename, remote_folder)
+        return sr.AssetRef(os.path.basename(filename))
+
+    def start_render(self, settings, scene):
+        self.recipes.append(snapshot(scene, settings))
+        return MockSession.start_render(self, settings, scene)
+
+
+class RebuiltScene(object):
+    """Stands for a `LiveScene`, building every variant from scratch.
+
+    A live scene records the calls changing it in place from one frame to
+    the next, while the capture wants the scene each render describes.
+    """
+
+    def __init__(self, recipe, assets=None):
+        self.assets = assets
+
+    def build(self, variant):
+        return variant.build(self.assets)
+
+
+@contextlib.contextmanager
+def recording_werender():
+    """Makes `wr.Scene()` and friends record into recipes."""
+    saved = wr.Scene, wr.RenderSettings, wr.Color, wr.Transform
+    live_scene = frame_sequence.LiveScene
+    scenes = []
+
+    def new_scene():
+        recipe = sr.SceneRecipe()
+        scenes.append(recipe)
+        return recipe.scene
+
+    def new_settings():
+        # the settings of the last scene, unless they are already in use
+        recipe = scenes.pop() if scenes else sr.SceneRecipe()
+        return recipe.settings
+
+    wr.Scene, wr.RenderSettings = new_scene, new_settings
+    wr.Color, wr.Transform = sr.Color, sr.Transform
+    frame_sequence.LiveScene = RebuiltScene
+    try:
+        yield
+    finally:
+        wr.Scene, wr.RenderSettings, wr.Color, wr.Transform = saved
+        frame_sequence.LiveScene = live_scene
+
+
+def capture_examples(root):
+    """Returns [(name, recipes)] for every entry point of every example."""
+    captured = []
+    for filename in example_files(root):
+        module = load_example(filename)
+        for entry in ENTRIES:
+            if not hasattr(module, entry):
+                continue
+            session = CaptureSession()
+            with recording_werender(), \
+                    contextlib.redirect_stdout(io.StringIO()):
+                getattr(module, entry)(session)
+            name = os.path.splitext(os.path.basename(filename))[0]
+            if entry != 'main':
+                name += '.' + entry
+            captured.append((name, session.recipes))
+    return captured
+
+
+def synthetic_scene(assignments=100000, models=100, materials=1000):
+    recipe = sr.SceneRecipe()
+    scene = recipe.scene
+    generic = wr.materials.Generic
+    model_nodes = [scene.new_model(recipe.asset('part_{:03d}.usd'.format(i)))
+                   for i in range(models)]
+    material_nodes = [scene.new_material(generic) for _ in range(materials)]
+    for i, material in enumerate(material_nodes):
+        material.set_color(sr.Color(i % 7 / 7.0, i % 11 / 11.0, i % 13 / 13.0))
+        material.set_roughness(i % 10 / 10.0)
+    for i in range(assignments):
+        model_nodes[i % models].assign_material(
+            material_nodes[i % materials], '.*/part_{:04d}.*'.format(
+                i // models))
+    return recipe
+
+
+def to_json(recipe):
+    ops = [[result, target, method, sr.canonical(args)]
+           for result, target, method, args in recipe.all_ops()]
+    return json.dumps(ops, separators=(',', ':')).encode('utf-8')
+
+
+def best_time(function, items, repeat):
+    """Returns the results of `function` on `items` and the best time."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [function(item) for item in items]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return results, best
+
+
+def measure(recipes, repeat):
+    """Returns sizes (json, binary, compressed, float32) and best times."""
+    sizes = [0, 0, 0, 0]
+    texts, json_encode = best_time(to_json, recipes, repeat)
+    _, json_decode = best_time(json.loads, texts, repeat)
+    encoded, encode_time = best_time(recipe_codec.encode, recipes, repeat)
+    decoded, decode_time = best_time(recipe_codec.decode, encoded, repeat)
+    times = [json_encode, json_decode, encode_time, decode_time]
+    for recipe, data, back in zip(recipes, encoded, decoded):
+        if recipe_hash(back) != recipe_hash(recipe):
+            raise AssertionError('recipe changed by encoding')
+        sizes[0] += len(to_json(recipe))
+        sizes[1] += len(recipe_codec.encode(recipe, compress=False))
+        sizes[2] += len(data)
+        sizes[3] += len(recipe_codec.encode(recipe, float32=True))
+    return sizes, times
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Compare the recipe encodings on the example scenes.')
+    parser.add_argument('--root', default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    # keep the caches of the examples away from the user's ones
+    scratch_caches()
+
+    scenes = capture_examples(os.path.abspath(args.root))
+    scenes.append(('synthetic 100k assignments', [synthetic_scene()]))
+
+    # sizes in bytes, times in milliseconds for all the jobs of a scene
+    row = '{:<32} {:>4} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8} {:>8}'
+    print(row.format('scene', 'jobs', 'json', 'binary', 'zlib', 'zlib f32',
+                     'json enc', 'json dec', 'enc', 'dec'))
+    for name, recipes in scenes:
+        if not recipes:
+            continue
+        sizes, times = measure(recipes, args.repeat)
+        print(row.format(name[:32], len(recipes), *sizes + [
+            '{:.2f}'.format(t * 1e3) for t in times]))
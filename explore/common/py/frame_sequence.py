@@ -0,0 +1,81 @@
+# Copyright 2022 J-CUBE Inc. Yokohama, Japan. All Rights Reserved.
+# https://werender.io
+#   common: frame sequences described as per-frame deltas
+
+from batch import submit_variant
+from scene_recipe import LiveScene
+
+
+class FrameSequence(object):
+    """The frames of an animation: one scene recipe plus a delta per frame.
+
+    The scene is recorded once in `recipe`; each frame only records what
+    changes, i.e. the frame number, the image name and any extra override
+    (see `batch.apply_overrides()`), e.g. the transform of a rotating light:
+
+        sequence = FrameSequence(recipe)
+        for frame in range(num_frames):
+            sequence.add(frame, 'turntable_{:02d}.png'.format(frame),
+                         {'area_light.apply_xform': xform})
+        requests = sequence.submit(session, assets)
+
+    The scene is built once, on the first submission, and each frame only
+    applies its delta to it before being submitted (see
+    `scene_recipe.LiveScene`), so frames are submitted one at a time, from
+    the calling thread.
+    """
+
+    def __init__(self, recipe):
+        self.recipe = recipe
+        self.frames = []
+        self.deltas = []
+        self._live = None
+
+    def __len__(self):
+        return len(self.frames)
+
+    def add(self, frame, image_name, overrides=None):
+        """Adds `frame`, rendered to `image_name`, with extra `overrides`."""
+        delta = {'settings.set_frame': frame,
+                 'settings.set_image_name': image_name}
+        delta.update(overrides or {})
+        self.frames.append(frame)
+        self.deltas.append(delta)
+
+    def image_name(self, index):
+        return self.deltas[index]['settings.set_image_name']
+
+    def live_scene(self, assets):
+        """Returns the `LiveScene` the frames are built on, built once."""
+        if self._live is None:
+            self._live = LiveScene(self.recipe, assets)
+        return self._live
+
+    def submit(self, session, assets, cache=None, asset_keys=None,
+               journal=None):
+        """Submits every frame, returns the render requests in frame order.
+
+        With a `render_cache.RenderCache`, frames rendered before are served
+        from the remote storage; with a `job_journal.JobJournal`, the frames
+        of an interrupted run are resumed (see `batch.submit_variant()`).
+        """
+        return self.submit_deltas(session, assets, self.deltas, cache,
+                                  asset_keys, journal)
+
+    def submit_deltas(self, session, assets, deltas, cache=None,
+                      asset_keys=None, journal=None):
+        """Submits one render per delta of the sequence's recipe, in order.
+
+        E.g. the frames with other settings; returns the render requests.
+        """
+        live = self.live_scene(assets)
+        return [submit_variant(session, self.recipe, delta, assets, cache,
+                               asset_keys, journal, live)
+                for delta in deltas]
+
+    def submit_frame(self, session, assets, index, cache=None,
+                     asset_keys=None, journal=None):
+        """Submits the frame at `index` alone, e.g. to retry it."""
+        return submit_variant(session, self.recipe, self.deltas[index], assets,
+                              cache, asset_keys, journal,
+                              self.live_scene(assets))
@@ -0,0 +1,247 @@
+# Copyright 2022 J-CUBE Inc. Yokohama, Japan. All Rights Reserved.
+# https://werender.io
+#   common: HDRI preparation for Envhdri lights
+#
+# Needs `numpy` and the `OpenEXR` python bindings (3.3 or later); without
+# them the HDRIs are uploaded unchanged.
+
+import os
+
+import numpy as np
+
+from upload_cache import UploadCache
+
+try:
+    import OpenEXR
+except ImportError:
+    OpenEXR = None
+
+# Rec. 709 luminance of linear RGB
+LUMINANCE = np.array([0.2126, 0.7152, 0.0722], dtype=np.float32)
+
+
+def default_cache_dir():
+    """Returns the folder of the prepared HDRIs.
+
+    It can be moved with the `WERENDER_HDRI_CACHE` environment variable.
+    """
+    return os.environ.get(
+        'WERENDER_HDRI_CACHE',
+        os.path.join(os.path.expanduser('~'), '.cache', 'werender-examples',
+                     'hdri'))
+
+
+def hdri_names(recipe):
+    """Returns the asset names of the images `recipe` lights with."""
+    files = {}
+    hdri_textures = []
+    for _, target, method, args in recipe.all_ops():
+        if method == 'set_texture_file' and args:
+            files[target] = getattr(args[0], 'name', None)
+        elif method == 'set_hdri_image' and args:
+            hdri_textures.append(getattr(args[0], 'index', None))
+    names = []
+    for texture in hdri_textures:
+        name = files.get(texture)
+        if name is not None and name not in names:
+            names.append(name)
+    return names
+
+
+def load_hdri(filename):
+    """Returns the linear RGB pixels of an EXR file as a float32 array."""
+    # the channels are released with the file
+    with OpenEXR.File(filename) as f:
+        channels = f.channels()
+        if 'RGB' in channels or 'RGBA' in channels:
+            pixels = channels.get('RGB', channels.get('RGBA')).pixels
+            return np.array(pixels[..., :3], dtype=np.float32)
+        return np.stack([channels[name].pixels for name in 'RGB'],
+                        axis=-1).astype(np.float32)
+
+
+def save_hdri(filename, rgb, half=True):
+    """Writes linear RGB pixels to a zip-compressed EXR file."""
+    header = {'compression': OpenEXR.ZIP_COMPRESSION,
+              'type': OpenEXR.scanlineimage}
+    pixels = rgb.astype(np.float16 if half else np.float32)
+    OpenEXR.File(header, {'RGB': np.ascontiguousarray(pixels)}).write(
+        filename)
+
+
+def resample_axis(rgb, size, axis):
+    """Returns `rgb` box-filtered down to `size` pixels along `axis`.
+
+    Each output pixel averages the input pixels it covers, weighted by how
+    much of them it covers, so the factor needs not be an integer.
+    """
+    length = rgb.shape[axis]
+    if size >= length:
+        return rgb
+    scale = length / float(size)
+    starts = np.arange(size) * scale
+    ends = starts + scale
+    first = np.floor(starts).astype(np.int64)
+    shape = [1] * rgb.ndim
+    shape[axis] = size
+    result = np.zeros(rgb.shape[:axis] + (size,) + rgb.shape[axis + 1:],
+                      dtype=np.float32)
+    for offset in range(int(np.ceil(scale)) + 1):
+        index = first + offset
+        weight = np.clip(np.minimum(ends, index + 1) -
+                         np.maximum(starts, index), 0.0, None) / scale
+        result += (np.take(rgb, np.minimum(index, length - 1), axis=axis) *
+                   weight.astype(np.float32).reshape(shape))
+    return result
+
+
+def downsample(rgb, max_width):
+    """Returns `rgb` box-filtered down to `max_width` columns.
+
+    The rows are scaled by the same ratio, so a lat-long image keeps its 2:1
+    aspect, e.g. 512 x 256 becomes 200 x 100.
+    """
+    height, width = rgb.shape[:2]
+    if width <= max_width:
+        return rgb
+    rows = max(int(round(height * max_width / float(width))), 1)
+    return resample_axis(resample_axis(rgb, max_width, 1), rows, 0)
+
+
+def importance_map(rgb):
+    """Returns the luminance distribution of a lat-long image.
+
+    `conditional` holds the normalized CDF of every row (H x W+1) and
+    `marginal` the one of the rows (H+1), weighted by the solid angle each
+    row covers, so directions are sampled proportionally to the light they
+    bring; `integral` is the mean weighted luminance.
+    """
+    height, width = rgb.shape[:2]
+    theta = (np.arange(height, dtype=np.float32) + 0.5) * (np.pi / height)
+    pdf = np.maximum(rgb @ LUMINANCE, 0.0) * np.sin(theta)[:, None]
+
+    conditional = np.zeros((height, width + 1), dtype=np.float64)
+    np.cumsum(pdf, axis=1, dtype=np.float64, out=conditional[:, 1:])
+    row_sums = conditional[:, -1].copy()
+    # black rows are sampled uniformly
+    empty = row_sums <= 0.0
+    conditional[empty, 1:] = np.arange(1, width + 1)
+    conditional /= conditional[:, -1:]
+
+    marginal = np.zeros(height + 1, dtype=np.float64)
+    np.cumsum(row_sums, out=marginal[1:])
+    total = marginal[-1]
+    marginal = (marginal / total if total > 0.0 else
+                np.linspace(0.0, 1.0, height + 1))
+    return {'conditional': conditional.astype(np.float32),
+            'marginal': marginal.astype(np.float32),
+            'integral': np.float32(total / (height * width))}
+
+
+def sample_directions(importance, uniforms):
+    """Returns (row, column) pixel coordinates sampled by `importance`.
+
+    `uniforms` is an (N, 2) array of numbers in [0, 1); handy to check a map
+    or to find the directions a key light comes from.
+    """
+    marginal = importance['marginal']
+    conditional = importance['conditional']
+    rows = np.clip(np.searchsorted(marginal, uniforms[:, 0], side='right') - 1,
+                   0, len(marginal) - 2)
+    cdfs = conditional[rows]
+    columns = (cdfs <= uniforms[:, 1:2]).sum(axis=1) - 1
+    return rows, np.clip(columns, 0, conditional.shape[1] - 2)
+
+
+class HdriPrep(object):
+    """Converts HDRIs once, before they are uploaded.
+
+    An HDRI is written as half-float EXR, optionally box-filtered down to
+    `max_width` for previews. With `importance`, its importance map (see
+    `importance_map()`) is also saved next to it as a `.npz` file, e.g. to
+    find the directions of its key lights with `sample_directions()`; no
+    render reads it, so it is only computed when asked for. Results are
+    cached by the sha256 of the source:
+
+        prep = HdriPrep(max_width=1024, importance=True)
+        image, importance = prep.prepare(resolve_file('snow.exr'))
+    """
+
+    def __init__(self, max_width=None, half=True, importance=False,
+                 cache_dir=None, digests=None):
+        self.max_width = max_width
+        self.half = half
+        self.importance = importance
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.digests = digests or UploadCache()
+        self.converted = 0
+        self.reused = 0
+
+    def prepared_files(self, filename):
+        """Returns the (image, importance map) files of `filename`."""
+        digest = self.digests.digest(filename)
+        root = os.path.splitext(os.path.basename(filename))[0]
+        suffix = '_{}'.format(self.max_width) if self.max_width else ''
+        if self.half:
+            suffix += '_half'
+        base = os.path.join(self.cache_dir, digest[:16], root + suffix)
+        return base + '.exr', base + '.importance.npz'
+
+    def prepare(self, filename):
+        """Returns (file to upload, importance map file or None).
+
+        Anything but an existing EXR file, or any file when OpenEXR is not
+        installed, is returned unchanged. The importance map file is None
+        unless `importance` is set.
+        """
+        if (OpenEXR is None or not os.path.exists(filename) or
+                os.path.splitext(filename)[1].lower() != '.exr'):
+            return filename, None
+        image_file, importance_file = self.prepared_files(filename)
+        rgb = None
+        if os.path.exists(image_file):
+            self.reused += 1
+        else:
+            rgb = load_hdri(filename)
+            if self.max_width:
+                rgb = downsample(rgb, self.max_width)
+            if self.half:
+                # clamp to the half-float range, the sun can exceed it
+                rgb = np.minimum(rgb, np.finfo(np.float16).max)
+            folder = os.path.dirname(image_file)
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+            # written aside, so that an interrupted run is never reused
+            save_hdri(image_file + '.tmp.exr', rgb, self.half)
+            os.replace(image_file + '.tmp.exr', image_file)
+            self.converted += 1
+        if not self.importance:
+            return image_file, None
+        if not os.path.exists(importance_file):
+            if rgb is None:
+                rgb = load_hdri(image_file)
+            with open(importance_file + '.tmp', 'wb') as f:
+                np.savez_compressed(f, **importance_map(rgb))
+            os.replace(importance_file + '.tmp', importance_file)
+        return image_file, importance_file
+
+    def report(self):
+        return 'hdri: {} converted, {} reused'.format(self.converted,
+                                                      self.reused)
+
+
+def prepare_hdris(recipe, resolve_file, **kwargs):
+    """Prepares the HDRIs of `recipe`, returns a `resolve_file` using them.
+
+    Pass the returned function to `upload_assets()`; keyword arguments go
+    to `HdriPrep`.
+    """
+    prep = HdriPrep(**kwargs)
+    prepared = {}
+    for name in hdri_names(recipe):
+        prepared[name] = prep.prepare(resolve_file(name))[0]
+    print(prep.report())
+
+    def resolve(name):
+        return prepared.get(name) or resolve_file(name)
+    return resolve
@@ -0,0 +1,249 @@
+# Copyright 2022 J-CUBE Inc. Yokohama, Japan. All Rights Reserved.
+# https://werender.io
+#   common: resuming interrupted batches of renders
+
+import os
+import sqlite3
+import threading
+import time
+
+from render_cache import CachedRender, StandIn, recipe_hash, render_path
+
+SUBMITTED = 'submitted'
+DONE = 'done'
+FAILED = 'failed'
+
+
+def default_journal_file():
+    """Returns the path of the job journal.
+
+    It can be moved with the `WERENDER_JOB_JOURNAL` environment variable.
+    """
+    return os.environ.get(
+        'WERENDER_JOB_JOURNAL',
+        os.path.join(os.path.expanduser('~'), '.cache', 'werender-examples',
+                     'jobs.sqlite'))
+
+
+class _Pending(object):
+    """The status of a render that has not finished yet."""
+    done = False
+    failed = False
+
+
+class ResumedRender(StandIn):
+    """A render still in flight when an earlier run stopped.
+
+    The request of another process cannot be queried, so the render is
+    re-attached to through the remote path of its image: it is done as soon
+    as the image can be referenced. If the image has not appeared by
+    `deadline` (a time), the job is taken as gone and `resubmit()` is called
+    once; its request is queried from then on.
+    """
+
+    def __init__(self, session, path, request_id, deadline, resubmit):
+        self.session = session
+        self.path = path
+        self.request_id = request_id
+        self.deadline = deadline
+        self.resubmit = resubmit
+        self.request = None
+
+    def __repr__(self):
+        return 'ResumedRender({!r})'.format(self.path)
+
+    def query(self):
+        if self.request is not None:
+            if isinstance(self.request, StandIn):
+                return self.request.query()
+            return self.session.query_render(self.request)
+        try:
+            asset = self.session.reference_asset(self.path)
+        except Exception:
+            asset = None
+        if asset is not None:
+            # the image stands for the request from now on
+            self.request = CachedRender(self.session, asset, self.path)
+            return self.request
+        if time.time() >= self.deadline:
+            self.request = self.resubmit()
+            return self.query()
+        return _Pending()
+
+
+class JobJournal(object):
+    """Records every submitted render in a local SQLite database.
+
+    Each job is keyed by the hash of its recipe (see
+    `render_cache.recipe_hash()`) and stores the request ID, the image name,
+    the remote path of the image and its state (submitted, done or failed).
+    Every change is committed straight away, so the journal survives a crash
+    or a Ctrl-C while waiting for the renders:
+
+        journal = JobJournal(resume=True)
+        request = journal.submit(session, recipe, assets, asset_keys)
+        ...
+        journal.complete(request, status)
+
+    When resuming, a job recorded as done is not submitted again, its image
+    is referenced from the cloud storage like a cached render. So is a job
+    still submitted when the run stopped whose image is there by now: it
+    finished while nothing was waiting for it. One whose image is not there
+    yet is re-attached to as a `ResumedRender`, submitted again only if its
+    image has not appeared `timeout` seconds after it was submitted. Only
+    the missing and failed jobs are submitted straight away, as well as the
+    in-flight ones whose remote path other journaled renders wrote to, since
+    an image found there may not be theirs. Without `resume`, every job is
+    submitted and its entry replaced.
+    """
+
+    def __init__(self, journal_file=None, resume=False, timeout=3600.0):
+        self.journal_file = journal_file or default_journal_file()
+        self.resume = resume
+        self.timeout = timeout
+        self.reused = 0
+        self.reattached = 0
+        self.submitted = 0
+        self._lock = threading.Lock()
+        self._keys = {}
+        folder = os.path.dirname(self.journal_file)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        # shared by the submission threads, serialized by the lock
+        self._db = sqlite3.connect(self.journal_file, check_same_thread=False)
+        with self._db:
+            self._db.execute('PRAGMA journal_mode=WAL')
+            self._db.execute(
+                'CREATE TABLE IF NOT EXISTS jobs ('
+                'scene_hash TEXT PRIMARY KEY, request_id TEXT, '
+                'image_name TEXT, path TEXT, state TEXT, updated REAL)')
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def lookup(self, scene_hash):
+        """Returns (request ID, image name, path, state, updated) or None."""
+        with self._lock:
+            return self._db.execute(
+                'SELECT request_id, image_name, path, state, updated '
+                'FROM jobs WHERE scene_hash = ?', (scene_hash,)).fetchone()
+
+    def shares_path(self, scene_hash, path):
+        """Returns whether another journaled job renders to `path`."""
+        with self._lock:
+            return self._db.execute(
+                'SELECT 1 FROM jobs WHERE path = ? AND scene_hash != ? '
+                'LIMIT 1', (path, scene_hash)).fetchone() is not None
+
+    def jobs(self, state=None):
+        """Returns the (scene hash, request ID, image name, state) of jobs."""
+        query = 'SELECT scene_hash, request_id, image_name, state FROM jobs'
+        with self._lock:
+            if state is None:
+                return self._db.execute(query).fetchall()
+            return self._db.execute(query + ' WHERE state = ?',
+                                    (state,)).fetchall()
+
+    def record(self, scene_hash, request, image_name, path, state):
+        request_id = getattr(request, 'request_id', None)
+        with self._lock:
+            with self._db:
+                self._db.execute(
+                    'INSERT OR REPLACE INTO jobs (scene_hash, request_id, '
+                    'image_name, path, state, updated) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (scene_hash, None if request_id is None else
+                     str(request_id), image_name, path, state, time.time()))
+
+    def _resume(self, session, scene_hash, entry, resubmit):
+        """Returns what stands for a journaled job, or None to submit it."""
+        request_id, image_name, path, state, updated = entry
+        if state not in (DONE, SUBMITTED) or path is None:
+            return None
+        if state == SUBMITTED and self.shares_path(scene_hash, path):
+            return None
+        try:
+            asset = session.reference_asset(path)
+        except Exception:
+            asset = None
+        if asset is not None:
+            if state == SUBMITTED:
+                self.record(scene_hash, None, image_name, path, DONE)
+            with self._lock:
+                self.reused += 1
+            return CachedRender(session, asset, path)
+        if state == DONE:
+            return None
+        with self._lock:
+            self.reattached += 1
+        return ResumedRender(session, path, request_id,
+                             (updated or 0.0) + self.timeout, resubmit)
+
+    def _submit(self, session, scene_hash, recipe, assets, asset_keys, cache,
+                live):
+        path = render_path(recipe)
+        if cache is not None:
+            request = cache.submit(session, recipe, assets, asset_keys, live)
+        elif live is not None:
+            scene, settings = live.build(recipe)
+            request = session.start_render(settings, scene)
+        else:
+            scene, settings = recipe.build(assets)
+            request = session.start_render(settings, scene)
+        image_name = None if path is None else path.rsplit('/', 1)[-1]
+        if isinstance(request, CachedRender):
+            self.record(scene_hash, None, image_name, request.path, DONE)
+        else:
+            self.record(scene_hash, request, image_name, path, SUBMITTED)
+            with self._lock:
+                self.submitted += 1
+        return request
+
+    def submit(self, session, recipe, assets, asset_keys=None, cache=None,
+               live=None):
+        """Submits `recipe` and journals it, unless it can be resumed.
+
+        With a `render_cache.RenderCache` the submission goes through it,
+        with a `scene_recipe.LiveScene` of its base `recipe` is built in
+        place. Returns the render request, a `CachedRender` for a finished
+        job or a `ResumedRender` for one still in flight (which is submitted
+        again directly if it turns out to be gone).
+        """
+        scene_hash = recipe_hash(recipe, asset_keys)
+        request = None
+        if self.resume:
+            entry = self.lookup(scene_hash)
+            if entry is not None:
+                def resubmit():
+                    return self._submit(session, scene_hash, recipe, assets,
+                                        asset_keys, None, live)
+                request = self._resume(session, scene_hash, entry, resubmit)
+                if isinstance(request, CachedRender):
+                    return request
+        if request is None:
+            request = self._submit(session, scene_hash, recipe, assets,
+                                   asset_keys, cache, live)
+            if isinstance(request, CachedRender):
+                return request
+        with self._lock:
+            self._keys[request] = scene_hash
+        return request
+
+    def complete(self, request, status):
+        """Records the final state of a render returned by `submit()`."""
+        with self._lock:
+            scene_hash = self._keys.pop(request, None)
+            if scene_hash is None:
+                return
+            with self._db:
+                self._db.execute(
+                    'UPDATE jobs SET state = ?, updated = ? '
+                    'WHERE scene_hash = ?',
+                    (FAILED if status.failed else DONE, time.time(),
+                     scene_hash))
+
+    def report(self):
+        return ('job journal: {} finished before, {} re-attached, '
+                '{} submitted').format(self.reused, self.reattached,
+                                       self.submitted)
@@ -0,0 +1,233 @@
+# Copyright 2022 J-CUBE Inc. Yokohama, Japan. All Rights Reserved.
+# https://werender.io
+#   common: local stand-in for a WeRender session
+#
+# Run any example offline, e.g:
+#   python mock_session.py ../../by-feature/bump/py/bump.py --failure-rate 0.1
+
+import argparse
+import glob
+import importlib.util
+import itertools
+import os
+import random
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+
+def placeholder_png(width=64, height=64, gray=128):
+    """Returns the bytes of a flat gray PNG image."""
+    def chunk(tag, data):
+        return (struct.pack('>I', len(data)) + tag + data +
+                struct.pack('>I', zlib.crc32(tag + data) & 0xffffffff))
+
+    row = b'\x00' + bytes([gray]) * width
+    return (b'\x89PNG\r\n\x1a\n' +
+            chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 0, 0, 0, 0)) +
+            chunk(b'IDAT', zlib.compress(row * height)) +
+            chunk(b'IEND', b''))
+
+
+class MockAsset(object):
+    """A file in the (pretend) cloud storage."""
+
+    def __init__(self, path, size=0):
+        self.path = path
+        self.size = size
+
+    def __repr__(self):
+        return 'MockAsset({!r})'.format(self.path)
+
+
+class MockRenderResult(object):
+
+    def __init__(self, session, request):
+        self._session = session
+        self._request = request
+
+    def get_asset(self):
+        return MockAsset(self._request.remote_path)
+
+    def download_image(self, folder, filename=None):
+        """Writes a placeholder image (PNG data, whatever the extension)."""
+        filename = filename or os.path.basename(self._request.remote_path)
+        return self._session._download(os.path.join(folder, filename))
+
+
+class MockRenderStatus(object):
+
+    def __init__(self, session, request, done, failed):
+        self._session = session
+        self._request = request
+        self.done = done
+        self.failed = failed
+
+    def get_result(self):
+        if not self.done or self.failed:
+            raise RuntimeError('render {} has no result'.format(
+                self._request.request_id))
+        return MockRenderResult(self._session, self._request)
+
+
+class MockRenderRequest(object):
+
+    def __init__(self, request_id, finish_time, failed):
+        self.request_id = request_id
+        self.finish_time = finish_time
+        self.failed = failed
+        self.remote_path = '/MyRenders/render_{:05d}.png'.format(request_id)
+
+    def __repr__(self):
+        return 'MockRenderRequest({})'.format(self.request_id)
+
+
+class MockSession(object):
+    """Implements the session API used by the examples without any network.
+
+    Every call sleeps `latency` seconds (a round trip), uploads and downloads
+    additionally take `size / bandwidth` seconds when `bandwidth` (bytes per
+    second) is given, renders take a random time in `render_time` and fail
+    with probability `failure_rate`. Nothing is rendered: results are flat
+    placeholder images. Call counts and bytes moved are kept in `stats`, which
+    makes the client-side overhead of an example measurable offline.
+
+    Pass a `seed` for reproducible render times and failures.
+    """
+
+    def __init__(self, latency=0.05, render_time=(0.5, 2.0), failure_rate=0.0,
+                 bandwidth=None, image_size=(64, 64), seed=None):
+        self.latency = latency
+        self.render_time = render_time
+        self.failure_rate = failure_rate
+        self.bandwidth = bandwidth
+        self.image = placeholder_png(*image_size)
+        self.stats = dict.fromkeys(
+            ['upload', 'reference_asset', 'start_render', 'query_render',
+             'create_video_clip', 'download', 'bytes_up', 'bytes_down'], 0)
+        self._random = random.Random(seed)
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _call(self, name, nbytes=0, counter=None):
+        with self._lock:
+            self.stats[name] += 1
+            if counter:
+                self.stats[counter] += nbytes
+        delay = self.latency
+        if nbytes and self.bandwidth:
+            delay += float(nbytes) / self.bandwidth
+        time.sleep(delay)
+
+    def _download(self, filename):
+        self._call('download', len(self.image), 'bytes_down')
+        with open(filename, 'wb') as f:
+            f.write(self.image)
+        return filename
+
+    def upload(self, filename, remote_folder):
+        # the example assets are not always available locally: a missing file
+        # is uploaded as an empty one
+        size = os.path.getsize(filename) if os.path.exists(filename) else 0
+        self._call('upload', size, 'bytes_up')
+        return MockAsset(
+            remote_folder.rstrip('/') + '/' + os.path.basename(filename), size)
+
+    def reference_asset(self, path):
+        self._call('reference_asset')
+        return MockAsset(path)
+
+    def start_render(self, settings, scene):
+        self._call('start_render')
+        with self._lock:
+            duration = self._random.uniform(*self.render_time)
+            failed = self._random.random() < self.failure_rate
+        return MockRenderRequest(next(self._ids), time.time() + duration,
+                                 failed)
+
+    def query_render(self, request):
+        self._call('query_render')
+        done = time.time() >= request.finish_time
+        return MockRenderStatus(self, request, done, done and request.failed)
+
+    def start_render_and_wait(self, settings, scene):
+        request = self.start_render(settings, scene)
+        time.sleep(max(0.0, request.finish_time - time.time()))
+        status = self.query_render(request)
+        if status.failed:
+            raise RuntimeError('render {} failed'.format(request.request_id))
+        return status.get_result()
+
+    def create_video_clip(self, assets, video_settings):
+        self._call('create_video_clip')
+        return MockAsset('/MyRenders/clip_{:05d}.mp4'.format(next(self._ids)))
+
+    def download_asset(self, asset, folder):
+        return self._download(
+            os.path.join(folder, os.path.basename(asset.path)))
+
+
+# the caches the examples keep, by environment variable and default name
+CACHES = (('WERENDER_UPLOAD_CACHE', 'uploads.json'),
+          ('WERENDER_RENDER_CACHE', 'renders.json'),
+          ('WERENDER_PRIM_CACHE', 'prims.json'),
+          ('WERENDER_JOB_JOURNAL', 'jobs.sqlite'),
+          ('WERENDER_TEXTURE_CACHE', 'textures'),
+          ('WERENDER_HDRI_CACHE', 'hdri'))
+
+
+def scratch_caches(folder=None):
+    """Moves every cache of the examples to `folder`, returns the folder.
+
+    A new temporary folder is used by default. Runs against a mock session
+    must not write to the user's caches: a later live run would reuse
+    renders that were never made.
+    """
+    folder = folder or tempfile.mkdtemp(prefix='werender-mock-')
+    for variable, name in CACHES:
+        os.environ[variable] = os.path.join(folder, name)
+    return folder
+
+
+def example_files(root):
+    """Returns the example scripts under `root` (the `explore` folder)."""
+    return [filename for filename in sorted(
+        glob.glob(os.path.join(root, '*', '*', 'py', '*.py')))
+        if os.sep + 'common' + os.sep not in filename]
+
+
+def load_example(filename):
+    """Imports an example script as a module, without running `__main__`."""
+    name = os.path.splitext(os.path.basename(filename))[0]
+    spec = importlib.util.spec_from_file_location(name, filename)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Run an example against a local mock session.')
+    parser.add_argument('example', help='path to an example script')
+    parser.add_argument('--entry', default='main',
+                        help='function to call with the session')
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument('--render-time', type=float, nargs=2,
+                        default=(0.5, 2.0))
+    parser.add_argument('--failure-rate', type=float, default=0.0)
+    parser.add_argument('--bandwidth', type=float, default=None,
+                        help='bytes per second')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    # keep the mock renders out of the caches a live run reuses
+    scratch_caches()
+    session = MockSession(latency=args.latency, render_time=args.render_time,
+                          failure_rate=args.failure_rate,
+                          bandwidth=args.bandwidth, seed=args.seed)
+    start = time.time()
+    getattr(load_example(args.example), args.entry)(session)
+    print('{}: {:.2f}s {}'.format(
+        os.path.basename(args.example), time.time() - start, session.stats))
@@ -0,0 +1,129 @@
+# Copyright 2022 J-CUBE Inc. Yokohama, Japan. All Rights Reserved.
+# https://werender.io
+#   common: coarse-to-fine scheduling of frame sequences
+
+import bisect
+import os
+import shutil
+import threading
+
+from render_queue import process_as_completed
+from scene_recipe import base_resolution
+
+
+def preview_name(image_name):
+    root, ext = os.path.splitext(image_name)
+    return root + '_preview' + ext
+
+
+class PreviewFirst(object):
+    """Schedules a `FrameSequence` coarse to fine.
+
+    Every `step`-th frame is submitted first as a preview, at `scale` times
+    the resolution and `pixel_samples` samples per pixel, then the previews
+    of the frames in between (unless `fill` is False) and only then the
+    frames at full quality. Renders start in submission order, so the whole
+    motion can be reviewed after a fraction of the final render time:
+
+        preview = PreviewFirst(sequence, step=4)
+        previews, requests = preview.submit(session, assets)
+        streamer = preview.stream(session, previews, preview_folder)
+        ... wait for the full quality requests ...
+        streamer.join()
+    """
+
+    def __init__(self, sequence, step=4, scale=0.25, pixel_samples=4,
+                 fill=True):
+        self.sequence = sequence
+        self.step = max(step, 1)
+        self.scale = scale
+        self.pixel_samples = pixel_samples
+        self.fill = fill
+
+    def key_frames(self):
+        """Returns the indices of the frames previewed first."""
+        return list(range(0, len(self.sequence), self.step))
+
+    def fill_frames(self):
+        """Returns the indices of the frames previewed once the keys are in."""
+        if not self.fill:
+            return []
+        return [i for i in range(len(self.sequence)) if i % self.step != 0]
+
+    def preview_order(self):
+        """Returns the indices of the previewed frames, in submission order."""
+        return self.key_frames() + self.fill_frames()
+
+    def preview_overrides(self, index):
+        overrides = dict(self.sequence.deltas[index])
+        overrides['settings.set_image_name'] = preview_name(
+            self.sequence.image_name(index))
+        overrides['settings.set_pixel_samples'] = self.pixel_samples
+        resolution = base_resolution(self.sequence.recipe)
+        if resolution is not None:
+            overrides['settings.set_resolution'] = tuple(
+                max(int(round(size * self.scale)), 1) for size in resolution)
+        return overrides
+
+    def submit(self, session, assets, **kwargs):
+        """Submits the previews, then the full quality frames.
+
+        The previews of the key frames are all submitted before those of the
+        frames in between, which are all submitted before the full quality
+        frames. Returns the preview requests (in `preview_order()`) and the
+        full quality requests (in frame order). Extra keyword arguments are
+        passed to `FrameSequence.submit()`, e.g. a render cache.
+        """
+        previews = self.sequence.submit_deltas(
+            session, assets,
+            [self.preview_overrides(i) for i in self.preview_order()])
+        requests = self.sequence.submit(session, assets, **kwargs)
+        return previews, requests
+
+    def stream(self, session, previews, folder, report=print):
+        """Downloads the previews to `folder` as they land, in a thread.
+
+        Each preview is stored under its frame's image name, and frames whose
+        preview has not landed yet hold the nearest preview before them (or
+        after, at the start), so `folder` always holds a complete sequence to
+        scrub. Failed previews are reported with `report(message)`, e.g. the
+        progress output of the full quality frames. Returns the started
+        thread.
+        """
+        order = self.preview_order()
+        landed = []
+        lock = threading.Lock()
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+
+        def path(index):
+            return os.path.join(folder, self.sequence.image_name(index))
+
+        def download(i, status):
+            if status.failed:
+                report('preview {} failed!'.format(order[i]))
+                return
+            index = order[i]
+            # download aside, frames holding another preview are copied over
+            # under the lock
+            downloaded = preview_name(self.sequence.image_name(index))
+            status.get_result().download_image(folder, downloaded)
+            with lock:
+                os.replace(os.path.join(folder, downloaded), path(index))
+                position = bisect.bisect(landed, index)
+                landed.insert(position, index)
+                # the frames up to the next landed preview hold this one
+                end = landed[position + 1] if position + 1 < len(landed) \
+                    else len(self.sequence)
+                start = index + 1 if position > 0 else 0
+                for other in range(start, end):
+                    if other != index:
+                        shutil.copyfile(path(index), path(other))
+
+        def run():
+            process_as_completed(session, previews, download)
+
+        thread = threading.Thread(target=run)
+        thread.daemon = True
+        thread.start()
+        return thread
@@ -0,0 +1,201 @@
+# Copyright 2022 J-CUBE Inc. Yokohama, Japan. All Rights Reserved.
+# https://werender.io
+#   common: checking material assignments against the prims of USD assets
+#
+# The prims of binary USD files are read with `pxr` (usd-core) when it is
+# installed; text (usda) files are parsed without it.
+
+import json
+import os
+import re
+import threading
+
+from scene_recipe import AssetRef, NodeRef
+from upload_cache import UploadCache
+
+try:
+    from pxr import Usd
+except ImportError:
+    Usd = None
+
+_usda_prim = re.compile(r'^\s*(?:def|over|class)\b[^"]*"([^"]+)"')
+
+
+def _usda_prim_paths(filename):
+    paths = []
+    stack = []
+    pending = None
+    depth = 0
+    with open(filename) as f:
+        for line in f:
+            match = _usda_prim.match(line)
+            if match:
+                pending = match.group(1)
+            for char in line:
+                if char == '{':
+                    depth += 1
+                    if pending is not None:
+                        stack.append((depth, pending))
+                        paths.append('/' + '/'.join(n for _, n in stack))
+                        pending = None
+                elif char == '}':
+                    if stack and stack[-1][0] == depth:
+                        stack.pop()
+                    depth -= 1
+    return paths
+
+
+def read_prim_paths(filename):
+    """Returns the prim paths of a USD file, or None if they cannot be read."""
+    if Usd is not None:
+        stage = Usd.Stage.Open(filename)
+        return [str(prim.GetPath()) for prim in stage.Traverse()]
+    with open(filename, 'rb') as f:
+        if not f.read(5) == b'#usda':
+            return None
+    return _usda_prim_paths(filename)
+
+
+def default_cache_file():
+    return os.environ.get(
+        'WERENDER_PRIM_CACHE',
+        os.path.join(os.path.expanduser('~'), '.cache', 'werender-examples',
+                     'prims.json'))
+
+
+class PrimIndex(object):
+    """The sorted prim paths of USD assets, cached by content hash.
+
+    Listing the prims of a large asset means opening its stage, so the paths
+    are stored in a local file keyed by the asset's sha256 and only read
+    again when the asset changes.
+    """
+
+    def __init__(self, cache_file=None, digests=None):
+        self.cache_file = cache_file or default_cache_file()
+        self.digests = digests or UploadCache()
+        self._lock = threading.Lock()
+        try:
+            with open(self.cache_file) as f:
+                self._paths = json.load(f)
+        except (IOError, OSError, ValueError):
+            self._paths = {}
+
+    def _save(self):
+        folder = os.path.dirname(self.cache_file)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        tmp_file = self.cache_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump(self._paths, f)
+        os.replace(tmp_file, self.cache_file)
+
+    def paths(self, filename):
+        """Returns the sorted prim paths of `filename`, None if unknown."""
+        if not os.path.exists(filename):
+            return None
+        digest = self.digests.digest(filename)
+        with self._lock:
+            if digest in self._paths:
+                return self._paths[digest]
+        paths = read_prim_paths(filename)
+        if paths is None:
+            return None
+        paths = sorted(paths)
+        with self._lock:
+            self._paths[digest] = paths
+            self._save()
+        return paths
+
+
+class BindingMatcher(object):
+    """The material assignments of one model, compiled into one regex.
+
+    `patterns` are the assignment patterns in call order (None assigns the
+    whole model); a later assignment overrides the earlier ones. The
+    alternatives are compiled latest first, so matching a prim path once
+    gives the assignment it ends up with.
+    """
+
+    def __init__(self, patterns):
+        self.patterns = [pattern if pattern is not None else '.*'
+                         for pattern in patterns]
+        self.matcher = re.compile('|'.join(
+            '(?P<_p{}>{})'.format(i, self.patterns[i])
+            for i in reversed(range(len(self.patterns)))))
+
+    def binding(self, path):
+        """Returns the index of the assignment `path` ends up with, or None."""
+        match = self.matcher.fullmatch(path)
+        return None if match is None else int(match.lastgroup[2:])
+
+    def resolve(self, paths):
+        """Returns {path: assignment index} for the paths with a material."""
+        bindings = {}
+        for path in paths:
+            index = self.binding(path)
+            if index is not None:
+                bindings[path] = index
+        return bindings
+
+    def unused(self, paths, bindings=None):
+        """Returns the assignments matching no path and those always overridden.
+
+        Only the assignments that no prim ends up with are matched again, one
+        by one, to tell them apart.
+        """
+        if bindings is None:
+            bindings = self.resolve(paths)
+        used = set(bindings.values())
+        unmatched = []
+        overridden = []
+        for index, pattern in enumerate(self.patterns):
+            if index in used:
+                continue
+            compiled = re.compile(pattern)
+            if any(compiled.fullmatch(path) for path in paths):
+                overridden.append(index)
+            else:
+                unmatched.append(index)
+        return unmatched, overridden
+
+
+def model_assignments(recipe):
+    """Returns {model index: (asset name, [(material index, pattern)])}."""
+    models = {}
+    for result, _, method, args in recipe.all_ops():
+        if method == 'new_model' and args and isinstance(args[0], AssetRef):
+            models[result] = (args[0].name, [])
+    for _, target, method, args in recipe.all_ops():
+        if method == 'assign_material' and target in models:
+            material = args[0].index if isinstance(args[0], NodeRef) else None
+            pattern = args[1] if len(args) > 1 else None
+            models[target][1].append((material, pattern))
+    return models
+
+
+def check_material_bindings(recipe, resolve_file, index=None):
+    """Checks the material assignments of `recipe` against its USD assets.
+
+    Resolves the material of every prim of every model in one pass and
+    returns warnings for the patterns matching no prim, or only prims that a
+    later assignment overrides, so that they can be fixed before paying for
+    a render. Assets whose prims cannot be read are skipped.
+    """
+    index = index or PrimIndex()
+    warnings = []
+    models = model_assignments(recipe)
+    for _, (asset, assignments) in sorted(models.items()):
+        paths = index.paths(resolve_file(asset))
+        if paths is None or not assignments:
+            continue
+        matcher = BindingMatcher([pattern for _, pattern in assignments])
+        unmatched, overridden = matcher.unused(paths)
+        for i, problem in sorted([(i, 'matches no prim') for i in unmatched] +
+                                 [(i, 'is always overridden')
+                                  for i in overridden]):
+            pattern = assignments[i][1]
+            warnings.append('{}: assignment #{} ({!r}) {}'.format(
+                asset, i + 1, pattern if pattern is not None else '.*',
+                problem))
+    return warnings
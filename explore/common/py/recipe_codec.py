@@ -0,0 +1,272 @@
+# Copyright 2022 J-CUBE Inc. Yokohama, Japan. All Rights Reserved.
+# https://werender.io
+#   common: compact binary encoding of scene recipes
+#
+# Layout (little endian, version 1):
+#   b'WRRC', version (u8), flags (u8), then the body, zlib-compressed when
+#   flags & COMPRESSED:
+#   strings: count, then (length, utf-8 bytes) for each
+#   names:   count, then (string index, node) for each
+#   ops:     count, then (result + 1 or 0, target, method string index,
+#            argument count, arguments) for each
+# Counts, indices and integers are varints (integers zigzag-encoded), each
+# argument is a tag byte followed by its value; colors and transforms are
+# packed arrays of 3 and 9 floats (float32 when flags & FLOAT32).
+
+import importlib
+import struct
+import zlib
+
+import werender as wr
+
+from scene_recipe import (AssetRef, Color, Keywords, NodeRef, SceneRecipe,
+                          Transform)
+
+MAGIC = b'WRRC'
+VERSION = 1
+
+COMPRESSED = 1
+FLOAT32 = 2
+
+(_NONE, _FALSE, _TRUE, _INT, _FLOAT, _STR, _NODE, _ASSET, _COLOR, _XFORM,
+ _TUPLE, _TYPE, _KWARGS) = range(13)
+
+
+def _write_varint(out, value):
+    while value > 0x7f:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _type_name(value):
+    # werender constants are found by the name they are reached with
+    for namespace in ('cameras', 'lights', 'materials', 'textures'):
+        module = getattr(wr, namespace, None)
+        for name in dir(module) if module is not None else ():
+            if getattr(module, name, None) is value:
+                return 'werender', namespace + '.' + name
+    name = getattr(value, '__qualname__', None)
+    if name is None:
+        raise ValueError('cannot encode {!r}'.format(value))
+    return value.__module__, name
+
+
+def _resolve_type(module, name):
+    value = importlib.import_module(module)
+    try:
+        for part in name.split('.'):
+            value = getattr(value, part)
+    except AttributeError:
+        raise ValueError('cannot decode {}.{}'.format(module, name))
+    return value
+
+
+class _Encoder(object):
+
+    def __init__(self, flags):
+        self.floats = '<{}f' if flags & FLOAT32 else '<{}d'
+        self.strings = {}
+        self.types = {}
+        self.out = bytearray()
+
+    def string(self, value):
+        index = self.strings.get(value)
+        if index is None:
+            index = self.strings[value] = len(self.strings)
+        _write_varint(self.out, index)
+
+    def value(self, value):
+        out = self.out
+        if value is None:
+            out.append(_NONE)
+        elif value is True or value is False:
+            out.append(_TRUE if value else _FALSE)
+        elif isinstance(value, NodeRef):
+            out.append(_NODE)
+            _write_varint(out, value.index)
+        elif isinstance(value, AssetRef):
+            out.append(_ASSET)
+            self.string(value.name)
+        elif isinstance(value, Color):
+            out.append(_COLOR)
+            out += struct.pack(self.floats.format(3), *value)
+        elif isinstance(value, Transform):
+            out.append(_XFORM)
+            out += struct.pack(self.floats.format(9), *value.key())
+        elif isinstance(value, Keywords):
+            out.append(_KWARGS)
+            _write_varint(out, len(value))
+            for name, item in value:
+                self.string(name)
+                self.value(item)
+        elif isinstance(value, tuple):
+            out.append(_TUPLE)
+            _write_varint(out, len(value))
+            for item in value:
+                self.value(item)
+        elif isinstance(value, int):
+            out.append(_INT)
+            _write_varint(out, value * 2 if value >= 0 else -value * 2 - 1)
+        elif isinstance(value, float):
+            # single floats are always kept exact
+            out.append(_FLOAT)
+            out += struct.pack('<d', value)
+        elif isinstance(value, str):
+            out.append(_STR)
+            self.string(value)
+        else:
+            if id(value) not in self.types:
+                self.types[id(value)] = _type_name(value)
+            module, name = self.types[id(value)]
+            out.append(_TYPE)
+            self.string(module)
+            self.string(name)
+
+
+def encode(recipe, compress=True, float32=False):
+    """Returns the bytes of `recipe`, including the templates it clones."""
+    flags = (COMPRESSED if compress else 0) | (FLOAT32 if float32 else 0)
+    encoder = _Encoder(flags)
+    out = encoder.out
+
+    names = {}
+    for template in recipe.chain():
+        names.update(template.names)
+    _write_varint(out, len(names))
+    for name, index in sorted(names.items()):
+        encoder.string(name)
+        _write_varint(out, index)
+
+    ops = recipe.all_ops()
+    _write_varint(out, len(ops))
+    for result, target, method, args in ops:
+        _write_varint(out, 0 if result is None else result + 1)
+        _write_varint(out, target)
+        encoder.string(method)
+        _write_varint(out, len(args))
+        for arg in args:
+            encoder.value(arg)
+
+    table = bytearray()
+    _write_varint(table, len(encoder.strings))
+    for string in encoder.strings:
+        data = string.encode('utf-8')
+        _write_varint(table, len(data))
+        table += data
+    body = bytes(table + out)
+    if compress:
+        body = zlib.compress(body, 6)
+    return MAGIC + struct.pack('<BB', VERSION, flags) + body
+
+
+def decode(data):
+    """Returns the `SceneRecipe` encoded in `data` by `encode()`."""
+    if data[:4] != MAGIC:
+        raise ValueError('not an encoded recipe')
+    version, flags = struct.unpack_from('<BB', data, 4)
+    if version != VERSION:
+        raise ValueError('unsupported recipe version {}'.format(version))
+    body = data[6:]
+    if flags & COMPRESSED:
+        body = zlib.decompress(body)
+    body = memoryview(body)
+    floats = 'f' if flags & FLOAT32 else 'd'
+    color_format = struct.Struct('<3' + floats)
+    xform_format = struct.Struct('<9' + floats)
+    float_format = struct.Struct('<d')
+
+    count, pos = _read_varint(body, 0)
+    strings = []
+    for _ in range(count):
+        size, pos = _read_varint(body, pos)
+        strings.append(str(body[pos:pos + size], 'utf-8'))
+        pos += size
+    types = {}
+
+    def value(pos):
+        tag = body[pos]
+        pos += 1
+        if tag == _NONE:
+            return None, pos
+        if tag == _FALSE:
+            return False, pos
+        if tag == _TRUE:
+            return True, pos
+        if tag == _INT:
+            raw, pos = _read_varint(body, pos)
+            return (raw >> 1) ^ -(raw & 1), pos
+        if tag == _FLOAT:
+            return float_format.unpack_from(body, pos)[0], pos + 8
+        if tag == _STR:
+            index, pos = _read_varint(body, pos)
+            return strings[index], pos
+        if tag == _NODE:
+            index, pos = _read_varint(body, pos)
+            return NodeRef(index), pos
+        if tag == _ASSET:
+            index, pos = _read_varint(body, pos)
+            return AssetRef(strings[index]), pos
+        if tag == _COLOR:
+            return (Color(*color_format.unpack_from(body, pos)),
+                    pos + color_format.size)
+        if tag == _XFORM:
+            v = xform_format.unpack_from(body, pos)
+            return (Transform(v[0:3], v[3:6], v[6:9]),
+                    pos + xform_format.size)
+        if tag == _TUPLE:
+            size, pos = _read_varint(body, pos)
+            items = []
+            for _ in range(size):
+                item, pos = value(pos)
+                items.append(item)
+            return tuple(items), pos
+        if tag == _KWARGS:
+            size, pos = _read_varint(body, pos)
+            kwargs = {}
+            for _ in range(size):
+                name, pos = _read_varint(body, pos)
+                kwargs[strings[name]], pos = value(pos)
+            return Keywords(kwargs), pos
+        if tag == _TYPE:
+            module, pos = _read_varint(body, pos)
+            name, pos = _read_varint(body, pos)
+            key = (module, name)
+            if key not in types:
+                types[key] = _resolve_type(strings[module], strings[name])
+            return types[key], pos
+        raise ValueError('unknown tag {}'.format(tag))
+
+    recipe = SceneRecipe()
+    count, pos = _read_varint(body, pos)
+    for _ in range(count):
+        name, pos = _read_varint(body, pos)
+        recipe.names[strings[name]], pos = _read_varint(body, pos)
+
+    count, pos = _read_varint(body, pos)
+    ops = recipe.ops
+    for _ in range(count):
+        result, pos = _read_varint(body, pos)
+        target, pos = _read_varint(body, pos)
+        method, pos = _read_varint(body, pos)
+        size, pos = _read_varint(body, pos)
+        args = []
+        for _ in range(size):
+            arg, pos = value(pos)
+            args.append(arg)
+        result = result - 1 if result else None
+        if result is not None:
+            recipe._count = max(recipe._count, result + 1)
+        ops.append((result, target, strings[method], tuple(args)))
+    return recipe
@@ -0,0 +1,228 @@
+# Copyright 2022 J-CUBE Inc. Yokohama, Japan. All Rights Reserved.
+# https://werender.io
+#   common: re-render only what changed
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+from scene_recipe import canonical
+from upload_cache import file_digest
+
+
+def default_cache_file():
+    """Returns the path of the persistent render index.
+
+    It can be moved with the `WERENDER_RENDER_CACHE` environment variable.
+    """
+    return os.environ.get(
+        'WERENDER_RENDER_CACHE',
+        os.path.join(os.path.expanduser('~'), '.cache', 'werender-examples',
+                     'renders.json'))
+
+
+def recipe_hash(recipe, asset_keys=None):
+    """Returns a deterministic sha256 hex digest of a recipe.
+
+    Every recorded call takes part (frame, image name and remote folder
+    included), so two recipes with the same hash render the same image to the
+    same place. `asset_keys` maps asset names to a key of their contents (see
+    `asset_digests()`), otherwise assets are identified by name only.
+    """
+    ops = [[result, target, method, canonical(args, asset_keys)]
+           for result, target, method, args in recipe.all_ops()]
+    data = json.dumps(ops, separators=(',', ':'), sort_keys=True)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def asset_digests(session, names, resolve_file):
+    """Returns {name: content digest} for the asset files `names`.
+
+    Digests come from the session's upload cache when it has one, so files
+    are not hashed twice; files missing locally are keyed by name.
+    """
+    cache = getattr(session, 'upload_cache', None)
+    digests = {}
+    for name in names:
+        filename = resolve_file(name)
+        if not os.path.exists(filename):
+            digests[name] = name
+        elif cache is not None:
+            digests[name] = cache.digest(filename)
+        else:
+            digests[name] = file_digest(filename)
+    return digests
+
+
+def render_path(recipe):
+    """Returns the remote path the image of `recipe` is stored at."""
+    folder = name = None
+    for _, _, method, args in recipe.all_ops():
+        if method == 'set_remote_folder':
+            folder = args[0]
+        elif method == 'set_image_name':
+            name = args[0]
+    if folder is None or name is None:
+        return None
+    return folder.rstrip('/') + '/' + name
+
+
+class StandIn(object):
+    """A stand-in for a render request that knows its own status."""
+
+    def query(self):
+        """Returns the current status, like `session.query_render()`."""
+        raise NotImplementedError
+
+
+def query_render(session, request):
+    """Returns the status of a render request or of a `StandIn`."""
+    if isinstance(request, StandIn):
+        return request.query()
+    return session.query_render(request)
+
+
+class CachedRender(StandIn):
+    """A render served from the remote storage instead of being submitted.
+
+    It stands in for the request, its (done) status and its result, so it
+    can be waited for and downloaded like any other render.
+    """
+    done = True
+    failed = False
+
+    def __init__(self, session, asset, path):
+        self.session = session
+        self.asset = asset
+        self.path = path
+
+    def __repr__(self):
+        return 'CachedRender({!r})'.format(self.path)
+
+    def query(self):
+        return self
+
+    def get_result(self):
+        return self
+
+    def get_asset(self):
+        return self.asset
+
+    def download_image(self, folder, filename=None):
+        if filename is None:
+            return self.session.download_asset(self.asset, folder)
+        # download_asset() keeps the remote name, rename it afterwards
+        tmp_folder = tempfile.mkdtemp(dir=folder)
+        try:
+            self.session.download_asset(self.asset, tmp_folder)
+            target = os.path.join(folder, filename)
+            os.replace(os.path.join(tmp_folder, os.path.basename(self.path)),
+                       target)
+            return target
+        finally:
+            shutil.rmtree(tmp_folder, ignore_errors=True)
+
+
+class RenderCache(object):
+    """Remembers which recipes have already been rendered, and where.
+
+    The index maps `recipe_hash()` to the remote path of the image, so an
+    unchanged frame or variant is referenced from `/MyRenders/...` instead
+    of being rendered again: tweak one material and only the renders using
+    it are submitted.
+
+        cache = RenderCache()
+        request = cache.submit(session, recipe, assets, asset_keys)
+        ...
+        cache.complete(request, status)
+
+    Like the upload cache, it cannot see remote deletions or overwrites made
+    by other means; a cached image that cannot be referenced any more is
+    rendered again.
+    """
+
+    def __init__(self, cache_file=None):
+        self.cache_file = cache_file or default_cache_file()
+        self._lock = threading.Lock()
+        self._renders = {}
+        self._submitted = {}
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_file) as f:
+                self._renders = json.load(f).get('renders', {})
+        except (IOError, OSError, ValueError):
+            return
+
+    def _save(self):
+        folder = os.path.dirname(self.cache_file)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        tmp_file = self.cache_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({'renders': self._renders}, f, indent=1, sort_keys=True)
+        os.replace(tmp_file, self.cache_file)
+
+    def lookup(self, key):
+        with self._lock:
+            return self._renders.get(key)
+
+    def record(self, key, path):
+        with self._lock:
+            # whatever was stored at the same remote path has been overwritten
+            for stale in [k for k, v in self._renders.items() if v == path]:
+                del self._renders[stale]
+            self._renders[key] = path
+            self._save()
+
+    def clear(self):
+        with self._lock:
+            self._renders = {}
+            self._save()
+
+    def submit(self, session, recipe, assets, asset_keys=None, live=None):
+        """Submits `recipe`, unless the same render already exists.
+
+        Returns a `CachedRender` on a hit, the render request otherwise; pass
+        the request and its status to `complete()` once it is done. With a
+        `scene_recipe.LiveScene` of its base, `recipe` is built in place.
+        """
+        key = recipe_hash(recipe, asset_keys)
+        path = render_path(recipe)
+        cached = self.lookup(key)
+        if cached is not None:
+            try:
+                asset = session.reference_asset(cached)
+            except Exception:
+                asset = None
+            if asset is not None:
+                with self._lock:
+                    self.hits += 1
+                return CachedRender(session, asset, cached)
+        if live is not None:
+            scene, settings = live.build(recipe)
+        else:
+            scene, settings = recipe.build(assets)
+        request = session.start_render(settings, scene)
+        with self._lock:
+            self.misses += 1
+            if path is not None:
+                self._submitted[request] = (key, path)
+        return request
+
+    def complete(self, request, status):
+        """Records the image of a finished render submitted by `submit()`."""
+        with self._lock:
+            entry = self._submitted.pop(request, None)
+        if entry is not None and status.done and not status.failed:
+            self.record(*entry)
+
+    def report(self):
+        return 'render cache: {} reused, {} submitted'.format(
+            self.hits, self.misses)
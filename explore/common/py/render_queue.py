@@ -0,0 +1,87 @@
+# Copyright 2022 J-CUBE Inc. Yokohama, Japan. All Rights Reserved.
+# https://werender.io
+#   common: waiting for asynchronous renders
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from render_cache import query_render
+
+
+def as_completed(session, requests, timeout=None, min_interval=0.25,
+                 max_interval=8.0, retry=None):
+    """Yields `(index, request, status)` for each render as soon as it is done.
+
+    Like `concurrent.futures.as_completed()`, but for the `RenderRequest`
+    objects returned by `session.start_render()`. Only the renders that are
+    still pending are queried, and the polling interval adapts: it goes back
+    to `min_interval` whenever a poll finds finished renders and doubles (up
+    to `max_interval`) while nothing changes.
+
+    `status.done` is true for failed renders too, check `status.failed`.
+    When given, `retry(index, request, status)` is called for each failed
+    render: if it returns a new request (e.g. the same render submitted
+    again) that one is waited for instead, without holding back the others.
+    Raises `TimeoutError` if renders are still pending after `timeout` seconds.
+    Stand-ins such as a `render_cache.CachedRender` give their own status
+    (see `render_cache.query_render()`).
+    """
+    pending = list(enumerate(requests))
+    deadline = None if timeout is None else time.time() + timeout
+    interval = min_interval
+    while pending:
+        still_pending = []
+        for index, request in pending:
+            status = query_render(session, request)
+            if status.failed and retry is not None:
+                retried = retry(index, request, status)
+                if retried is not None:
+                    still_pending.append((index, retried))
+                    continue
+            if status.done:
+                yield index, request, status
+            else:
+                still_pending.append((index, request))
+        if not still_pending:
+            return
+        if len(still_pending) < len(pending):
+            interval = min_interval
+        else:
+            interval = min(interval * 2.0, max_interval)
+        pending = still_pending
+        delay = interval
+        if deadline is not None:
+            remaining = deadline - time.time()
+            if remaining <= 0.0:
+                raise TimeoutError(
+                    '{} renders still pending'.format(len(pending)))
+            delay = min(delay, remaining)
+        time.sleep(delay)
+
+
+def wait_all(session, requests, **kwargs):
+    """Waits for all `requests`, returns their statuses in request order."""
+    statuses = [None] * len(requests)
+    for index, _, status in as_completed(session, requests, **kwargs):
+        statuses[index] = status
+    return statuses
+
+
+def process_as_completed(session, requests, handle, max_workers=4, **kwargs):
+    """Calls `handle(index, status)` for each render as soon as it is done.
+
+    The calls run on a pool of `max_workers` threads, so downloads of the
+    first finished renders overlap with the renders still running. Returns
+    the statuses in request order once every render has been handled; an
+    exception raised by `handle` is re-raised here. Extra keyword arguments
+    are passed to `as_completed()`.
+    """
+    statuses = [None] * len(requests)
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = []
+        for index, _, status in as_completed(session, requests, **kwargs):
+            statuses[index] = status
+            futures.append(pool.submit(handle, index, status))
+        for future in futures:
+            future.result()
+    return statuses
@@ -0,0 +1,183 @@
+# Copyright 2022 J-CUBE Inc. Yokohama, Japan. All Rights Reserved.
+# https://werender.io
+#   common: run every example concurrently with one session
+#
+# Authenticates once, then runs the examples on a thread pool, sharing the
+# session and its upload cache, e.g:
+#   python run_examples.py --examples 8 --in-flight 16
+#   python run_examples.py --mock --only by-feature
+
+import argparse
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from mock_session import (MockSession, example_files, load_example,
+                          scratch_caches)
+from upload_cache import CachedSession
+
+# the function run for each example: its `main(session)`, or what its
+# `__main__` calls for the scripts without one
+ENTRIES = ('main', 'render_frames', 'turntable_async')
+
+
+def example_entry(module):
+    """Returns the function to run for an example module, or None."""
+    for entry in ENTRIES:
+        if hasattr(module, entry):
+            return getattr(module, entry)
+    return None
+
+
+class ThrottledSession(object):
+    """A session shared by concurrent examples, bounding renders in flight.
+
+    At most `max_in_flight` renders run at once: `start_render()` waits for
+    a slot, which is given back once a query finds the render done, and
+    `start_render_and_wait()` holds one for the duration of the call. While
+    waiting for a slot, the pending renders are queried, so that an example
+    submitting a whole batch before waiting for it cannot block itself.
+    Concurrent uploads of the same file are sent once.
+
+    Every other attribute is forwarded to the wrapped session.
+    """
+
+    def __init__(self, session, max_in_flight=8, poll_interval=1.0):
+        self.session = session
+        self.max_in_flight = max_in_flight
+        self.poll_interval = poll_interval
+        self._lock = threading.Lock()
+        self._active = 0
+        self._pending = set()
+        self._uploads = {}
+
+    def _acquire(self):
+        while True:
+            with self._lock:
+                if self._active < self.max_in_flight:
+                    self._active += 1
+                    return
+                pending = list(self._pending)
+            for request in pending:
+                self.query_render(request)
+            with self._lock:
+                full = self._active >= self.max_in_flight
+            if full:
+                time.sleep(self.poll_interval)
+
+    def _release(self, request=None):
+        with self._lock:
+            if request is None:
+                self._active -= 1
+            elif request in self._pending:
+                self._pending.discard(request)
+                self._active -= 1
+
+    def start_render(self, settings, scene):
+        self._acquire()
+        try:
+            request = self.session.start_render(settings, scene)
+        except Exception:
+            self._release()
+            raise
+        with self._lock:
+            self._pending.add(request)
+        return request
+
+    def start_render_and_wait(self, settings, scene):
+        self._acquire()
+        try:
+            return self.session.start_render_and_wait(settings, scene)
+        finally:
+            self._release()
+
+    def query_render(self, request):
+        status = self.session.query_render(request)
+        if status.done:
+            self._release(request)
+        return status
+
+    def upload(self, filename, remote_folder):
+        key = (os.path.abspath(filename), remote_folder.rstrip('/'))
+        with self._lock:
+            entry = self._uploads.get(key)
+            owner = entry is None
+            if owner:
+                entry = self._uploads[key] = [threading.Event(), None, None]
+        if owner:
+            try:
+                entry[1] = self.session.upload(filename, remote_folder)
+            except Exception as e:
+                entry[2] = e
+                with self._lock:
+                    # the next example tries again
+                    del self._uploads[key]
+            entry[0].set()
+        else:
+            entry[0].wait()
+        if entry[2] is not None:
+            raise entry[2]
+        return entry[1]
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
+
+
+def run_examples(session, filenames, max_examples=4):
+    """Runs the examples concurrently, returns [(filename, seconds, error)].
+
+    An example raising an exception does not stop the others, its error is
+    returned instead.
+    """
+    def run(filename):
+        start = time.time()
+        try:
+            entry = example_entry(load_example(filename))
+            if entry is not None:
+                entry(session)
+            error = None
+        except Exception as e:
+            error = e
+        return filename, time.time() - start, error
+
+    with ThreadPoolExecutor(max_workers=max_examples) as pool:
+        return list(pool.map(run, filenames))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(
+        description='Run all the examples concurrently with one session.')
+    parser.add_argument('--root', default=os.path.join(
+        os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+    parser.add_argument('--only', default='',
+                        help='only run the examples whose path contains this')
+    parser.add_argument('--examples', type=int, default=4,
+                        help='examples running at once')
+    parser.add_argument('--in-flight', type=int, default=8,
+                        help='renders running at once')
+    parser.add_argument('--mock', action='store_true',
+                        help='run against a local mock session')
+    args = parser.parse_args()
+
+    filenames = [filename for filename in example_files(
+        os.path.abspath(args.root)) if args.only in filename]
+    if args.mock:
+        # the mock accepts assets that are not available locally; its
+        # renders must not land in the caches a live run reuses
+        scratch_caches()
+        session = MockSession()
+    else:
+        import werender as wr
+        session = CachedSession(wr.authenticate())
+    session = ThrottledSession(session, args.in_flight)
+
+    start = time.time()
+    results = run_examples(session, filenames, args.examples)
+    total = time.time() - start
+    for filename, seconds, error in sorted(results, key=lambda r: -r[1]):
+        print('{:<40} {:>8.2f}s {}'.format(
+            os.path.splitext(os.path.basename(filename))[0], seconds,
+            'ok' if error is None else 'failed: {!r}'.format(error)))
+    print('{} examples in {:.2f}s wall time ({:.2f}s summed)'.format(
+        len(results), total, sum(seconds for _, seconds, _ in results)))
@@ -0,0 +1,449 @@
+# Copyright 2022 J-CUBE Inc. Yokohama, Japan. All Rights Reserved.
+# https://werender.io
+#   common: recorded, cloneable scene descriptions
+
+import copy
+import functools
+import hashlib
+import json
+
+import werender as wr
+
+# node indices of the two roots of every recipe
+SCENE = 0
+SETTINGS = 1
+
+# calls creating nodes that can be shared when structurally equal
+SHAREABLE = ('new_material', 'new_texture')
+
+
+class Color(tuple):
+    """An RGB color recorded by value, built as a `wr.Color`."""
+
+    def __new__(cls, r, g, b):
+        return tuple.__new__(cls, (float(r), float(g), float(b)))
+
+    def __repr__(self):
+        return 'Color({}, {}, {})'.format(*self)
+
+    def build(self):
+        return wr.Color(*self)
+
+
+class Transform(object):
+    """A transform recorded by value, built as a `wr.Transform`.
+
+    Accepts the same keyword arguments as `wr.Transform`; rotations are
+    euler angles in degrees.
+    """
+
+    def __init__(self, translate=(0.0, 0.0, 0.0), rotate=(0.0, 0.0, 0.0),
+                 scale=(1.0, 1.0, 1.0)):
+        self.translate = tuple(float(v) for v in translate)
+        self.rotate = tuple(float(v) for v in rotate)
+        self.scale = tuple(float(v) for v in scale)
+
+    def set_translation(self, x, y, z):
+        self.translate = (float(x), float(y), float(z))
+
+    def set_rotation(self, x, y, z):
+        self.rotate = (float(x), float(y), float(z))
+
+    def set_scale(self, x, y, z):
+        self.scale = (float(x), float(y), float(z))
+
+    def key(self):
+        return self.translate + self.rotate + self.scale
+
+    def __eq__(self, other):
+        return isinstance(other, Transform) and self.key() == other.key()
+
+    def __hash__(self):
+        return hash(self.key())
+
+    def __repr__(self):
+        return 'Transform(translate={}, rotate={}, scale={})'.format(
+            self.translate, self.rotate, self.scale)
+
+    def build(self):
+        return wr.Transform(translate=self.translate, rotate=self.rotate,
+                            scale=self.scale)
+
+
+class AssetRef(tuple):
+    """Refers to an asset by file name; resolved when the recipe is built."""
+
+    def __new__(cls, name):
+        return tuple.__new__(cls, (name,))
+
+    @property
+    def name(self):
+        return self[0]
+
+    def __repr__(self):
+        return 'AssetRef({!r})'.format(self.name)
+
+
+class NodeRef(tuple):
+    """Refers to a node of a recipe by index, as stored in recorded calls."""
+
+    def __new__(cls, index):
+        return tuple.__new__(cls, (index,))
+
+    @property
+    def index(self):
+        return self[0]
+
+    def __repr__(self):
+        return 'NodeRef({})'.format(self.index)
+
+
+class Keywords(tuple):
+    """The keyword arguments of a recorded call, stored as its last argument.
+
+    Holds (name, value) pairs sorted by name; `build()` passes them as
+    keywords again.
+    """
+
+    def __new__(cls, kwargs):
+        return tuple.__new__(cls, sorted(kwargs.items()))
+
+    def __repr__(self):
+        return 'Keywords({})'.format(
+            ', '.join('{}={!r}'.format(*item) for item in self))
+
+
+def _split(args):
+    if args and type(args[-1]) is Keywords:
+        return args[:-1], dict(args[-1])
+    return args, {}
+
+
+class Node(object):
+    """Records every method call made on a scene, settings or scene item.
+
+    `new_*()` and `get_items()` calls return a new `Node`, all other calls
+    return None, like their `werender` counterparts.
+    """
+    __slots__ = ('recipe', 'index')
+
+    def __init__(self, recipe, index):
+        self.recipe = recipe
+        self.index = index
+
+    def __getattr__(self, method):
+        if method.startswith('_'):
+            raise AttributeError(method)
+        return functools.partial(self.recipe._record, self.index, method)
+
+    def __repr__(self):
+        return 'Node({})'.format(self.index)
+
+
+def _creates_node(method):
+    return method.startswith('new_') or method == 'get_items'
+
+
+def canonical(value, asset_keys=None, node_key=None):
+    """Returns a JSON-able description of a recorded argument.
+
+    `asset_keys` maps asset names to what identifies them (e.g. a content
+    digest), `node_key(index)` what identifies a node (its index otherwise).
+    """
+    if isinstance(value, NodeRef):
+        return ['node', node_key(value.index) if node_key else value.index]
+    if isinstance(value, AssetRef):
+        return ['asset', (asset_keys or {}).get(value.name, value.name)]
+    if isinstance(value, Color):
+        return ['color'] + [repr(v) for v in value]
+    if isinstance(value, Transform):
+        return ['xform'] + [repr(v) for v in value.key()]
+    if isinstance(value, Keywords):
+        return ['kwargs'] + [[name, canonical(v, asset_keys, node_key)]
+                             for name, v in value]
+    if isinstance(value, tuple):
+        return ['tuple'] + [canonical(v, asset_keys, node_key) for v in value]
+    if isinstance(value, float):
+        return ['float', repr(value)]
+    if value is None or isinstance(value, (bool, int, str)):
+        return value
+    # werender types and constants (camera, light, material kinds...)
+    name = getattr(value, '__qualname__', None)
+    if name is not None:
+        return ['type', getattr(value, '__module__', ''), name]
+    return ['repr', repr(value)]
+
+
+def _freeze(value):
+    if isinstance(value, Node):
+        return NodeRef(value.index)
+    if isinstance(value, Transform):
+        return copy.copy(value)
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+class SceneRecipe(object):
+    """A scene and its render settings described as a list of recorded calls.
+
+    `recipe.scene` and `recipe.settings` accept the same calls as
+    `wr.Scene` and `wr.RenderSettings`, which are only created when
+    `build()` replays the recipe. Use `Color`, `Transform` and
+    `recipe.asset()` for values so that the recipe stays independent of any
+    session:
+
+        base = SceneRecipe()
+        model = base.scene.new_model(base.asset('ground.usd'))
+        base.name('model', model)
+        variant = base.clone()
+        variant['model'].set_xform(Transform(translate=(0.0, 1.0, 0.0)))
+        scene, settings = variant.build(assets)
+
+    `clone()` is copy-on-write: a clone only stores the calls recorded on it
+    and refers to its base for the rest, so a template shared by hundreds of
+    variants is recorded once. A recipe cannot record calls once cloned.
+    """
+
+    def __init__(self, base=None):
+        self.base = base
+        self.ops = []
+        self.names = {}
+        self.frozen = False
+        self._count = base._count if base is not None else 2
+        self.scene = Node(self, SCENE)
+        self.settings = Node(self, SETTINGS)
+
+    def _record(self, target, method, *args, **kwargs):
+        if self.frozen:
+            raise RuntimeError('cannot record on a recipe that has clones')
+        result = None
+        if _creates_node(method):
+            result = self._count
+            self._count += 1
+        args = tuple(_freeze(arg) for arg in args)
+        if kwargs:
+            args += (Keywords(dict((name, _freeze(value))
+                                   for name, value in kwargs.items())),)
+        self.ops.append((result, target, method, args))
+        return None if result is None else Node(self, result)
+
+    def asset(self, name):
+        """Returns a reference to an asset, resolved by `build()`."""
+        return AssetRef(name)
+
+    def name(self, name, node):
+        """Names a node so that clones can find it with `clone[name]`."""
+        self.names[name] = node.index
+        return node
+
+    def __getitem__(self, name):
+        recipe = self
+        while recipe is not None:
+            if name in recipe.names:
+                return Node(self, recipe.names[name])
+            recipe = recipe.base
+        raise KeyError(name)
+
+    def bind(self, node):
+        """Returns `node` (e.g. of the base recipe) recording on this recipe."""
+        return Node(self, node.index)
+
+    def clone(self):
+        """Returns a copy-on-write variant of this recipe."""
+        self.frozen = True
+        return SceneRecipe(base=self)
+
+    def chain(self):
+        """Returns the recipes from the root template down to this one."""
+        recipes = []
+        recipe = self
+        while recipe is not None:
+            recipes.append(recipe)
+            recipe = recipe.base
+        return recipes[::-1]
+
+    def all_ops(self):
+        """Returns every recorded call, template calls first."""
+        ops = []
+        for recipe in self.chain():
+            ops.extend(recipe.ops)
+        return ops
+
+    def asset_names(self):
+        """Returns the file names of the referenced assets, in order."""
+        names = []
+        for _, _, _, args in self.all_ops():
+            for arg in args:
+                if isinstance(arg, AssetRef) and arg.name not in names:
+                    names.append(arg.name)
+        return names
+
+    def shared_nodes(self):
+        """Returns {index: index of the node replacing it} for duplicates.
+
+        Materials and textures are structurally equal when they are created
+        with the same arguments and receive the same calls, in the same
+        order, where textures they use are compared by structure too. Only
+        the first of equal nodes is kept.
+        """
+        created = {}
+        calls = {}
+        for result, target, method, args in self.all_ops():
+            if result is not None:
+                created[result] = (target, method, args)
+            else:
+                calls.setdefault(target, []).append((method, args))
+
+        keys = {}
+
+        def node_key(index):
+            if index not in created or created[index][1] not in SHAREABLE:
+                return index
+            if index not in keys:
+                keys[index] = None
+                target, method, args = created[index]
+                description = [node_key(target), method,
+                               canonical(args, node_key=node_key)]
+                for call, call_args in calls.get(index, []):
+                    description.append(
+                        [call, canonical(call_args, node_key=node_key)])
+                keys[index] = hashlib.sha1(json.dumps(
+                    description, separators=(',', ':')).encode(
+                        'utf-8')).hexdigest()
+            return keys[index]
+
+        shared = {}
+        first = {}
+        for index in sorted(created):
+            key = node_key(index)
+            if isinstance(key, str):
+                shared_index = first.setdefault(key, index)
+                if shared_index != index:
+                    shared[index] = shared_index
+        return shared
+
+    def build(self, assets=None, share=True):
+        """Replays the recipe, returns a `(wr.Scene, wr.RenderSettings)` pair.
+
+        `assets` maps the names given to `asset()` to uploaded assets. Unless
+        `share` is False, structurally equal materials and textures are
+        created once (see `shared_nodes()`).
+        """
+        assets = assets or {}
+        handles = {SCENE: wr.Scene(), SETTINGS: wr.RenderSettings()}
+        shared = self.shared_nodes() if share else {}
+        resolve = _resolver(handles, assets)
+
+        for result, target, method, args in self.all_ops():
+            if result in shared:
+                handles[result] = handles[shared[result]]
+                continue
+            if target in shared:
+                # the shared node has received the very same calls
+                continue
+            args, kwargs = _split(tuple(resolve(arg) for arg in args))
+            value = getattr(handles[target], method)(*args, **kwargs)
+            if result is not None:
+                handles[result] = value
+        return handles[SCENE], handles[SETTINGS]
+
+
+def _resolver(handles, assets):
+    """Returns a function building recorded arguments with `handles`."""
+    def resolve(value):
+        if isinstance(value, NodeRef):
+            return handles[value.index]
+        if isinstance(value, AssetRef):
+            return assets[value.name]
+        if isinstance(value, (Color, Transform)):
+            return value.build()
+        if type(value) is Keywords:
+            return Keywords(dict((name, resolve(v)) for name, v in value))
+        if type(value) is tuple:
+            return tuple(resolve(v) for v in value)
+        return value
+    return resolve
+
+
+class LiveScene(object):
+    """The scene of a recipe built once, then changed in place per clone.
+
+    `build(variant)` returns the scene and render settings of a clone of
+    `recipe` (e.g. a frame of a `frame_sequence.FrameSequence`) by replaying
+    only the calls recorded on the clone on the scene built from `recipe`;
+    the render settings are built anew each time. The nodes changed by the
+    previous variant first get the calls of `recipe` on them again, so that
+    e.g. an `apply_xform()` delta does not add up from one variant to the
+    next:
+
+        live = LiveScene(base, assets)
+        for xform in xforms:
+            variant = base.clone()
+            variant['light'].apply_xform(xform)
+            scene, settings = live.build(variant)
+            requests.append(session.start_render(settings, scene))
+
+    The scene is changed in place, so variants must be built and submitted
+    one at a time, on one thread. Nodes are not shared (see
+    `SceneRecipe.shared_nodes()`), so a variant changing a material does
+    not change the ones equal to it.
+    """
+
+    def __init__(self, recipe, assets=None):
+        self.recipe = recipe
+        self.handles = {SCENE: wr.Scene()}
+        self._resolve = _resolver(self.handles, assets or {})
+        self._settings = []
+        self._calls = {}
+        self._changed = []
+        for op in recipe.all_ops():
+            result, target = op[:2]
+            if target == SETTINGS:
+                self._settings.append(op)
+                continue
+            if result is None:
+                self._calls.setdefault(target, []).append(op)
+            self._replay(op)
+
+    def _replay(self, op):
+        result, target, method, args = op
+        args, kwargs = _split(tuple(self._resolve(arg) for arg in args))
+        value = getattr(self.handles[target], method)(*args, **kwargs)
+        if result is not None:
+            self.handles[result] = value
+
+    def build(self, variant):
+        """Returns `(wr.Scene, wr.RenderSettings)` for a clone of `recipe`."""
+        if variant.base is not self.recipe:
+            raise ValueError('variant is not a clone of the live recipe')
+        if any(result is not None for result, _, _, _ in variant.ops):
+            raise ValueError('variants of a live scene cannot create nodes')
+        self.handles[SETTINGS] = wr.RenderSettings()
+        for op in self._settings:
+            self._replay(op)
+        for target in self._changed:
+            for op in self._calls.get(target, ()):
+                self._replay(op)
+        self._changed = []
+        for op in variant.ops:
+            target = op[1]
+            if target != SETTINGS and target not in self._changed:
+                self._changed.append(target)
+            self._replay(op)
+        return self.handles[SCENE], self.handles[SETTINGS]
+
+
+def upload_assets(session, recipe, remote_folder, resolve_file):
+    """Uploads the assets referenced by `recipe`, returns {name: asset}."""
+    return dict((name, session.upload(resolve_file(name), remote_folder))
+                for name in recipe.asset_names())
+
+
+def base_resolution(recipe):
+    """Returns the (width, height) last set on the settings of `recipe`."""
+    resolution = None
+    for _, target, method, args in recipe.all_ops():
+        if target == SETTINGS and method == 'set_resolution':
+            resolution = args
+    return resolution
@@ -0,0 +1,338 @@
+# Copyright 2022 J-CUBE Inc. Yokohama, Japan. All Rights Reserved.
+# https://werender.io
+#   common: declarative parameter sweeps over a shared base scene
+#
+# Specs are JSON, or YAML when PyYAML is installed, e.g:
+#   {"image_name": "{chair}_{camera}_{seat}.png",
+#    "sample": {"method": "latin_hypercube", "count": 100, "seed": 0},
+#    "axes": [
+#      {"name": "chair", "key": "chair",
+#       "values": {"dsr": "chair_dsr.usd", "dsw": "chair_dsw.usd"}},
+#      {"name": "camera", "key": "camera.set_xform", "type": "transform",
+#       "values": {"wide": {"translate": [1560.6, 828.9, 2184.5],
+#                           "rotate": [-9.9, 35.8, 0.0]}}},
+#      {"name": "seat", "key": "mat_seat.set_color", "type": "color",
+#       "values": {"yellow": [0.71, 0.607, 0.0]}},
+#      {"name": "roughness", "key": "mat_seat.set_roughness",
+#       "range": [0.1, 0.9], "steps": 5}]}
+
+import itertools
+import json
+import os
+import random
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from batch import submit_variant
+from render_cache import query_render
+from scene_recipe import Color, Transform
+
+
+def load_spec(filename):
+    """Returns the sweep spec stored in a JSON or YAML file."""
+    with open(filename) as f:
+        if os.path.splitext(filename)[1].lower() in ('.yaml', '.yml'):
+            import yaml
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def _convert(kind, value):
+    if kind == 'color':
+        return Color(*value)
+    if kind == 'transform':
+        return Transform(**value)
+    if isinstance(value, list):
+        # several arguments
+        return tuple(value)
+    return value
+
+
+class Axis(object):
+    """One dimension of a sweep: the values of one override key.
+
+    Discrete axes list their `values` (a list, or a dict of label: value);
+    continuous ones give a `range`, split into `steps` values when the full
+    product is swept.
+    """
+
+    def __init__(self, spec):
+        self.name = spec['name']
+        self.key = spec.get('key', self.name)
+        self.kind = spec.get('type')
+        values = spec.get('values')
+        self.range = spec.get('range')
+        if values is None and self.range is not None and 'steps' in spec:
+            low, high = self.range
+            steps = spec['steps']
+            values = [low + (high - low) * i / max(1, steps - 1)
+                      for i in range(steps)]
+        if isinstance(values, dict):
+            self.labels = [str(label) for label in values]
+            self.values = list(values.values())
+        elif values is not None:
+            self.labels = [self.label(value) for value in values]
+            self.values = list(values)
+        else:
+            self.labels = self.values = None
+        if self.values is None and self.range is None:
+            raise ValueError('axis {!r} has neither values nor range'.format(
+                self.name))
+
+    @property
+    def discrete(self):
+        return self.values is not None
+
+    def __len__(self):
+        if not self.discrete:
+            raise ValueError('axis {!r} is continuous, give it steps'.format(
+                self.name))
+        return len(self.values)
+
+    @staticmethod
+    def label(value):
+        if isinstance(value, float):
+            return '{:.4g}'.format(value)
+        return str(value)
+
+    def at(self, position):
+        """Returns (label, value) at `position` in [0, 1) along the axis."""
+        if self.discrete:
+            return self.item(min(int(position * len(self.values)),
+                                 len(self.values) - 1))
+        low, high = self.range
+        value = low + (high - low) * position
+        return self.label(value), value
+
+    def item(self, index):
+        return self.labels[index], self.values[index]
+
+
+class Sweep(object):
+    """The variants of a declarative spec, generated lazily.
+
+    Iterating yields `(labels, overrides)` pairs, where `labels` maps each
+    axis name to the label of its value and `overrides` is what
+    `batch.submit_variant()` expects. Without a `sample` entry every
+    combination is generated, in order; with one, `count` variants are drawn
+    with the `latin_hypercube` or `random` method. Nothing but the current
+    variant is held in memory (a latin hypercube keeps one stratum
+    permutation per axis), so a sweep can be far larger than what fits in
+    memory as scenes. Every iteration yields the same variants:
+
+        sweep = Sweep(load_spec('chairs.json'))
+        print(len(sweep), 'variants')
+        for labels, overrides in sweep:
+            ...
+
+    Every variant renders to its own image, named by formatting the
+    `image_name` of the spec with its labels; it defaults to the labels of
+    all the axes joined by underscores, as a PNG.
+    """
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.axes = [Axis(axis) for axis in spec['axes']]
+        self.image_name = spec.get('image_name') or '_'.join(
+            '{' + axis.name + '}' for axis in self.axes) + '.png'
+        self.sample = spec.get('sample')
+        # a sample drawn without a seed is the same on every iteration
+        self.seed = None
+        if self.sample is not None:
+            self.seed = self.sample.get('seed')
+            if self.seed is None:
+                self.seed = random.randrange(1 << 32)
+        if self.sample is None:
+            for axis in self.axes:
+                if not axis.discrete:
+                    raise ValueError(
+                        'axis {!r} is continuous, give it steps or sample '
+                        'the sweep'.format(axis.name))
+
+    def size(self):
+        """Returns the number of combinations of the full product."""
+        size = 1
+        for axis in self.axes:
+            size *= len(axis)
+        return size
+
+    def __len__(self):
+        if self.sample is not None:
+            return self.sample_count()
+        return self.size()
+
+    def sample_count(self):
+        """Returns the number of variants drawn by the `sample` entry.
+
+        Distinct combinations are drawn when every axis is discrete, so no
+        more than `size()` of them.
+        """
+        count = self.sample['count']
+        if all(axis.discrete for axis in self.axes):
+            count = min(count, self.size())
+        return count
+
+    def __iter__(self):
+        if self.sample is None:
+            return self.product()
+        method = self.sample.get('method', 'random')
+        count = self.sample_count()
+        if method == 'latin_hypercube':
+            return self.latin_hypercube(count, self.seed)
+        if method == 'random':
+            return self.random_subset(count, self.seed)
+        raise ValueError('unknown sampling method {!r}'.format(method))
+
+    def variant(self, items):
+        """Returns (labels, overrides) for one (label, value) per axis."""
+        labels = {}
+        overrides = {}
+        for axis, (label, value) in zip(self.axes, items):
+            labels[axis.name] = label
+            overrides[axis.key] = _convert(axis.kind, value)
+        overrides['settings.set_image_name'] = self.image_name.format(
+            **labels)
+        return labels, overrides
+
+    def product(self):
+        """Yields every combination, the last axis varying fastest."""
+        for items in itertools.product(*[
+                [axis.item(i) for i in range(len(axis))]
+                for axis in self.axes]):
+            yield self.variant(items)
+
+    def combination(self, index):
+        """Returns the variant at `index` in the order of `product()`."""
+        items = []
+        for axis in reversed(self.axes):
+            index, i = divmod(index, len(axis))
+            items.append(axis.item(i))
+        return self.variant(reversed(items))
+
+    def random_subset(self, count, seed=None):
+        """Yields `count` variants drawn at random.
+
+        When every axis is discrete they are distinct combinations, drawn
+        without listing the product (at most `size()` of them); continuous
+        axes are drawn uniformly.
+        """
+        rng = random.Random(seed)
+        if all(axis.discrete for axis in self.axes):
+            for index in rng.sample(range(self.size()),
+                                    min(count, self.size())):
+                yield self.combination(index)
+            return
+        for _ in range(count):
+            yield self.variant([axis.at(rng.random()) for axis in self.axes])
+
+    def latin_hypercube(self, count, seed=None):
+        """Yields `count` variants covering every axis evenly.
+
+        Each axis is split in `count` strata and every stratum is used once,
+        so even a small sample spans the whole range of every parameter.
+        When every axis is discrete, strata falling on a combination already
+        drawn are replaced by distinct combinations drawn at random, and a
+        `count` covering the whole product draws it all with
+        `random_subset()`.
+        """
+        discrete = all(axis.discrete for axis in self.axes)
+        if discrete and count >= self.size():
+            for item in self.random_subset(count, seed):
+                yield item
+            return
+        rng = random.Random(seed)
+        strata = []
+        for _ in self.axes:
+            permutation = list(range(count))
+            rng.shuffle(permutation)
+            strata.append(permutation)
+        seen = set()
+        for i in range(count):
+            items = [axis.at((permutation[i] + rng.random()) / count)
+                     for axis, permutation in zip(self.axes, strata)]
+            if discrete:
+                index = 0
+                for axis, (label, _) in zip(self.axes, items):
+                    index = index * len(axis) + axis.labels.index(label)
+                if index in seen:
+                    continue
+                seen.add(index)
+            yield self.variant(items)
+        while discrete and len(seen) < count:
+            index = rng.randrange(self.size())
+            if index not in seen:
+                seen.add(index)
+                yield self.combination(index)
+
+def run_sweep(session, base, variants, assets, handle, max_in_flight=16,
+              max_workers=8, handle_workers=4, cache=None, asset_keys=None,
+              journal=None, min_interval=0.25, max_interval=8.0):
+    """Submits a stream of variants with at most `max_in_flight` pending.
+
+    `variants` is any iterable of `(labels, overrides)`, e.g. a `Sweep`; it
+    is only advanced when a slot is free, so the variants, their scenes and
+    their requests are never all in memory at once. Variants are built and
+    submitted on `max_workers` threads (see `batch.submit_variant()` for
+    `cache`, `asset_keys` and `journal`), and `handle(labels, request,
+    status)` is called as each render finishes, on a pool of
+    `handle_workers` threads, so e.g. downloads overlap with the renders
+    still running. A variant counts as in flight until it has been handled.
+    A variant whose submission raises does not stop the sweep:
+    `handle(labels, None, error)` is called with the exception instead; an
+    exception raised by `handle` is re-raised here. Returns the number of
+    variants handled.
+    """
+    variants = iter(variants)
+    submitting = {}
+    running = []
+    handling = []
+    handled = 0
+    exhausted = False
+    interval = min_interval
+    with ThreadPoolExecutor(max_workers=max_workers) as pool, \
+            ThreadPoolExecutor(max_workers=handle_workers) as handlers:
+        while True:
+            for future in [f for f in handling if f.done()]:
+                handling.remove(future)
+                future.result()
+                handled += 1
+            while (not exhausted and len(submitting) + len(running) +
+                   len(handling) < max_in_flight):
+                try:
+                    labels, overrides = next(variants)
+                except StopIteration:
+                    exhausted = True
+                    break
+                submitting[pool.submit(submit_variant, session, base,
+                                       overrides, assets, cache,
+                                       asset_keys, journal)] = labels
+            for future in [f for f in submitting if f.done()]:
+                labels = submitting.pop(future)
+                try:
+                    running.append((labels, future.result()))
+                except Exception as e:
+                    handling.append(handlers.submit(handle, labels, None, e))
+            if exhausted and not submitting and not running:
+                for future in handling:
+                    future.result()
+                return handled + len(handling)
+
+            still_running = []
+            for labels, request in running:
+                status = query_render(session, request)
+                if status.done:
+                    handling.append(handlers.submit(handle, labels, request,
+                                                    status))
+                else:
+                    still_running.append((labels, request))
+            progressed = len(still_running) < len(running)
+            running = still_running
+            if progressed:
+                interval = min_interval
+                continue
+            if submitting or handling:
+                wait(list(submitting) + handling, timeout=interval,
+                     return_when=FIRST_COMPLETED)
+            else:
+                time.sleep(interval)
+            interval = min(interval * 2.0, max_interval)
@@ -0,0 +1,229 @@
+# Copyright 2022 J-CUBE Inc. Yokohama, Japan. All Rights Reserved.
+# https://werender.io
+#   common: texture proxies sized for the output resolution
+#
+# Textures are converted to tiled, mipmapped `.tx` files with `oiiotool`
+# (OpenImageIO) when it is on the PATH; otherwise Pillow writes downscaled
+# proxies in the source format, with the mip levels as extra TIFF pages.
+
+import os
+import shutil
+import subprocess
+from concurrent.futures import ProcessPoolExecutor
+
+from scene_recipe import base_resolution
+from upload_cache import UploadCache
+
+# the image files converted, HDRIs (.exr, .hdr) are left alone
+TEXTURE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.tif', '.tiff')
+
+
+def default_cache_dir():
+    """Returns the folder of the converted textures.
+
+    It can be moved with the `WERENDER_TEXTURE_CACHE` environment variable.
+    """
+    return os.environ.get(
+        'WERENDER_TEXTURE_CACHE',
+        os.path.join(os.path.expanduser('~'), '.cache', 'werender-examples',
+                     'textures'))
+
+
+def texture_names(recipe):
+    """Returns the asset names `recipe` loads as texture files, in order."""
+    names = []
+    for _, _, method, args in recipe.all_ops():
+        if method != 'set_texture_file' or not args:
+            continue
+        name = getattr(args[0], 'name', None)
+        if (name is not None and name not in names and
+                os.path.splitext(name)[1].lower() in TEXTURE_EXTENSIONS):
+            names.append(name)
+    return names
+
+
+def proxy_size(size, resolution, texel_ratio=1.0):
+    """Returns the longest side of the proxy of a texture of `size`.
+
+    That is the smallest power of two covering `texel_ratio` texels per
+    pixel of the longest side of `resolution`, never more than the texture
+    itself.
+    """
+    target = 1
+    while target < texel_ratio * max(resolution):
+        target *= 2
+    return min(max(size), target)
+
+
+def _fit(image, longest):
+    width, height = image.size
+    scale = float(longest) / max(width, height)
+    if scale >= 1.0:
+        return image
+    return image.resize((max(1, int(round(width * scale))),
+                         max(1, int(round(height * scale)))),
+                        resample=3)  # bicubic
+
+
+def _mip_levels(image):
+    levels = []
+    while min(image.size) > 1:
+        image = image.reduce(2)
+        levels.append(image)
+    return levels
+
+
+def convert_texture(source, target, longest, tool=None):
+    """Writes the proxy of `source` to `target`, returns False if unreadable.
+
+    Runs in the worker processes of `TexturePrep`, hence a plain function.
+    """
+    folder = os.path.dirname(target)
+    if not os.path.isdir(folder):
+        os.makedirs(folder, exist_ok=True)
+    # written aside, so that an interrupted conversion is never reused
+    root, ext = os.path.splitext(target)
+    tmp_file = root + '.tmp' + ext
+    if tool is not None:
+        command = [tool, source, '--fit', '{0}x{0}'.format(longest),
+                   '-otex', tmp_file]
+        if subprocess.run(command, stdout=subprocess.DEVNULL,
+                          stderr=subprocess.DEVNULL).returncode != 0:
+            return False
+    else:
+        from PIL import Image
+        try:
+            image = Image.open(source)
+            image.load()
+        except (IOError, OSError):
+            return False
+        mode = image.mode
+        if mode == 'P':
+            image = image.convert('RGBA' if 'transparency' in image.info
+                                  else 'RGB')
+        elif mode.startswith('I;16'):
+            # 16-bit data is resampled as 32-bit integers
+            image = image.convert('I')
+        image = _fit(image, longest)
+        if ext.lower() in ('.tif', '.tiff'):
+            levels = [image] + _mip_levels(image)
+            if mode.startswith('I;16'):
+                levels = [level.convert(mode) for level in levels]
+            levels[0].save(tmp_file, compression='tiff_adobe_deflate',
+                           save_all=True, append_images=levels[1:])
+        elif ext.lower() in ('.jpg', '.jpeg'):
+            image.save(tmp_file, quality=95)
+        else:
+            image.save(tmp_file)
+    os.replace(tmp_file, target)
+    return True
+
+
+class TexturePrep(object):
+    """Converts textures on a process pool before they are uploaded.
+
+    Each texture gets a proxy whose longest side is `proxy_size()` of the
+    render resolution, e.g. 512 pixels instead of 4k for a 512x512 preview,
+    which cuts both the bytes uploaded and the time the render nodes spend
+    loading it. Proxies are cached by the sha256 of the source and their
+    size, so a texture is converted once until it changes:
+
+        prep = TexturePrep((512, 512))
+        files = prep.prepare([resolve_file('wood_col.jpg')])
+        print(prep.report())
+
+    Proxies are named after their source and size (`wood_col_512.tx`), so
+    they do not overwrite the originals in the cloud storage. `tool` is the
+    `oiiotool` executable, found on the PATH by default; pass False to
+    always use Pillow.
+    """
+
+    def __init__(self, resolution, texel_ratio=1.0, cache_dir=None,
+                 digests=None, max_workers=None, tool=None):
+        self.resolution = resolution
+        self.texel_ratio = texel_ratio
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.digests = digests or UploadCache()
+        self.max_workers = max_workers
+        self.tool = shutil.which('oiiotool') if tool is None else tool or None
+        self.converted = 0
+        self.reused = 0
+        self.source_bytes = 0
+        self.proxy_bytes = 0
+
+    def proxy_file(self, filename):
+        """Returns (proxy file, longest side) for `filename`, or None."""
+        from PIL import Image
+        try:
+            with Image.open(filename) as image:
+                size = image.size
+        except (IOError, OSError):
+            return None
+        longest = proxy_size(size, self.resolution, self.texel_ratio)
+        root, ext = os.path.splitext(os.path.basename(filename))
+        if self.tool is not None:
+            ext = '.tx'
+        elif longest == max(size):
+            # nothing to gain without a tiled format
+            return None
+        digest = self.digests.digest(filename)
+        return os.path.join(self.cache_dir, digest[:16], '{}_{}{}'.format(
+            root, longest, ext)), longest
+
+    def prepare(self, filenames):
+        """Returns {filename: file to upload instead} for `filenames`.
+
+        Files that are missing, unreadable or already small enough map to
+        themselves.
+        """
+        prepared = {}
+        jobs = {}
+        for filename in filenames:
+            prepared[filename] = filename
+            if not os.path.exists(filename):
+                continue
+            proxy = self.proxy_file(filename)
+            if proxy is None:
+                continue
+            if os.path.exists(proxy[0]):
+                prepared[filename] = proxy[0]
+                self.reused += 1
+            else:
+                jobs[filename] = proxy
+        if jobs:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as pool:
+                futures = dict(
+                    (filename, pool.submit(convert_texture, filename, target,
+                                           longest, self.tool))
+                    for filename, (target, longest) in jobs.items())
+                for filename, future in futures.items():
+                    if future.result():
+                        prepared[filename] = jobs[filename][0]
+                        self.converted += 1
+        for filename, proxy in prepared.items():
+            if proxy != filename:
+                self.source_bytes += os.path.getsize(filename)
+                self.proxy_bytes += os.path.getsize(proxy)
+        return prepared
+
+    def report(self):
+        return ('textures: {} converted, {} reused, {} bytes to upload '
+                'instead of {}').format(self.converted, self.reused,
+                                        self.proxy_bytes, self.source_bytes)
+
+
+def prepare_textures(recipe, resolve_file, resolution=None, **kwargs):
+    """Returns a `resolve_file` giving the texture proxies of `recipe`.
+
+    Pass it to `upload_assets()` instead of `resolve_file`; the resolution
+    defaults to the one `recipe` renders at.
+    """
+    prep = TexturePrep(resolution or base_resolution(recipe), **kwargs)
+    names = texture_names(recipe)
+    prepared = prep.prepare([resolve_file(name) for name in names])
+    print(prep.report())
+    proxies = dict((name, prepared[resolve_file(name)]) for name in names)
+
+    def resolve(name):
+        return proxies.get(name) or resolve_file(name)
+    return resolve
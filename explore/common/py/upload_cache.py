@@ -0,0 +1,163 @@
+# Copyright 2022 J-CUBE Inc. Yokohama, Japan. All Rights Reserved.
+# https://werender.io
+#   common: content-addressed upload cache
+
+import hashlib
+import http.client
+import json
+import os
+import threading
+import time
+
+
+def default_cache_file():
+    """Returns the path of the persistent upload index.
+
+    It can be moved with the `WERENDER_UPLOAD_CACHE` environment variable.
+    """
+    return os.environ.get(
+        'WERENDER_UPLOAD_CACHE',
+        os.path.join(os.path.expanduser('~'), '.cache', 'werender-examples',
+                     'uploads.json'))
+
+
+# the upload errors worth retrying: a dropped or timed out connection. A
+# missing file, bad credentials or a permission error fail straight away.
+TRANSIENT_ERRORS = (ConnectionError, TimeoutError, http.client.IncompleteRead)
+
+
+def file_digest(filename, chunk_size=1 << 20):
+    """Returns the sha256 hex digest of a local file, read in chunks."""
+    sha = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def remote_path(filename, remote_folder):
+    """Returns where `session.upload(filename, remote_folder)` stores a file."""
+    return remote_folder.rstrip('/') + '/' + os.path.basename(filename)
+
+
+class UploadCache(object):
+    """Remembers which local files already live in the cloud storage.
+
+    Entries are keyed by the sha256 of the file contents and the remote
+    folder, so renaming or touching a file does not cause a new upload while
+    editing it does. Digests are themselves cached by (size, mtime) so that
+    unchanged files are not re-hashed on every run.
+
+    Note: the cache cannot see remote deletions; call `clear()` (or remove
+    the cache file) if the cloud storage was cleaned up by other means.
+    """
+
+    def __init__(self, cache_file=None):
+        self.cache_file = cache_file or default_cache_file()
+        self._lock = threading.Lock()
+        self._digests = {}
+        self._uploads = {}
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.cache_file) as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+        self._digests = data.get('digests', {})
+        self._uploads = data.get('uploads', {})
+
+    def _save(self):
+        folder = os.path.dirname(self.cache_file)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        tmp_file = self.cache_file + '.tmp'
+        with open(tmp_file, 'w') as f:
+            json.dump({'digests': self._digests, 'uploads': self._uploads},
+                      f, indent=1, sort_keys=True)
+        os.replace(tmp_file, self.cache_file)
+
+    def digest(self, filename):
+        """Returns the content digest of `filename`, re-hashing if changed."""
+        filename = os.path.abspath(filename)
+        stat = os.stat(filename)
+        with self._lock:
+            entry = self._digests.get(filename)
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime:
+            return entry[2]
+        digest = file_digest(filename)
+        with self._lock:
+            self._digests[filename] = [stat.st_size, stat.st_mtime, digest]
+        return digest
+
+    @staticmethod
+    def _key(digest, remote_folder):
+        return digest + ':' + remote_folder.rstrip('/')
+
+    def lookup(self, filename, remote_folder):
+        """Returns the remote path holding `filename`'s bytes, or None."""
+        key = self._key(self.digest(filename), remote_folder)
+        with self._lock:
+            return self._uploads.get(key)
+
+    def record(self, filename, remote_folder):
+        """Records that `filename` has just been uploaded to `remote_folder`."""
+        key = self._key(self.digest(filename), remote_folder)
+        path = remote_path(filename, remote_folder)
+        with self._lock:
+            # whatever was stored at the same remote path has been overwritten
+            for stale in [k for k, v in self._uploads.items() if v == path]:
+                del self._uploads[stale]
+            self._uploads[key] = path
+            self._save()
+
+    def clear(self):
+        with self._lock:
+            self._digests = {}
+            self._uploads = {}
+            self._save()
+
+    def upload(self, session, filename, remote_folder, retries=3,
+               backoff=2.0):
+        """Same as `session.upload()`, skipping files already uploaded.
+
+        On a cache hit the remote asset is returned via
+        `session.reference_asset()` and no bytes are sent. An upload failing
+        with one of the `TRANSIENT_ERRORS` (e.g. a dropped connection) is
+        retried `retries` times with an exponential backoff, any other error
+        is raised straight away.
+        """
+        path = self.lookup(filename, remote_folder)
+        if path is not None:
+            return session.reference_asset(path)
+        for attempt in range(retries + 1):
+            try:
+                asset = session.upload(filename, remote_folder)
+                break
+            except TRANSIENT_ERRORS:
+                if attempt == retries:
+                    raise
+                time.sleep(backoff * 2 ** attempt)
+        self.record(filename, remote_folder)
+        return asset
+
+
+class CachedSession(object):
+    """Wraps a werender session so that `upload()` goes through the cache.
+
+    Every other attribute is forwarded to the wrapped session, so a
+    `CachedSession` can be passed to any `main(session)` unchanged.
+    """
+
+    def __init__(self, session, cache=None, retries=3):
+        self.session = session
+        self.upload_cache = cache or UploadCache()
+        self.retries = retries
+
+    def upload(self, filename, remote_folder):
+        return self.upload_cache.upload(self.session, filename, remote_folder,
+                                        retries=self.retries)
+
+    def __getattr__(self, name):
+        return getattr(self.session, name)
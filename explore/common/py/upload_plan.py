@@ -0,0 +1,112 @@
+# Copyright 2022 J-CUBE Inc. Yokohama, Japan. All Rights Reserved.
+# https://werender.io
+#   common: deduplicated, concurrent asset uploads
+
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class UploadPlan(object):
+    """Collects the assets a batch of renders needs and uploads them once.
+
+    Add every file a sweep needs with `add()` (duplicates are fine, that is
+    the point), then call `execute()` before building any scene: each unique
+    (file, remote folder) pair is uploaded exactly once on a bounded thread
+    pool, and the returned dictionary maps every key to its remote asset.
+    Requests are counted rather than stored, so a sweep can add its assets
+    once per variant. Files the session's upload cache (see
+    `upload_cache.CachedSession`) already holds are referenced, not sent.
+
+        plan = UploadPlan()
+        for name in ['chair.usd', 'backdrop.usd', 'chair.usd']:
+            plan.add(resolve_file(name), '/assets/examples', key=name)
+        assets = plan.execute(session)
+        print(plan.report())
+    """
+
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        # {(key, filename, remote folder): number of requests}, in order
+        self._requests = {}
+        self._sizes = {}
+        self._durations = {}
+        self._referenced = set()
+        self._wall_time = 0.0
+
+    def add(self, filename, remote_folder, key=None):
+        """Requests `filename` in `remote_folder`, returns the lookup key."""
+        key = filename if key is None else key
+        request = (key, filename, remote_folder)
+        self._requests[request] = self._requests.get(request, 0) + 1
+        return key
+
+    def unique_uploads(self):
+        """Returns the (filename, remote folder) pairs to upload, in order."""
+        seen = set()
+        unique = []
+        for _, filename, remote_folder in self._requests:
+            pair = (os.path.abspath(filename), remote_folder.rstrip('/'))
+            if pair not in seen:
+                seen.add(pair)
+                unique.append((filename, remote_folder))
+        return unique
+
+    def execute(self, session):
+        """Uploads the unique files concurrently, returns {key: asset}."""
+        upload_cache = getattr(session, 'upload_cache', None)
+
+        def upload(pair):
+            start = time.time()
+            referenced = (upload_cache is not None and
+                          upload_cache.lookup(*pair) is not None)
+            asset = session.upload(*pair)
+            return asset, time.time() - start, referenced
+
+        unique = self.unique_uploads()
+        start = time.time()
+        with ThreadPoolExecutor(max_workers=self.max_workers) as pool:
+            results = list(pool.map(upload, unique))
+        self._wall_time = time.time() - start
+
+        uploaded = {}
+        self._referenced = set()
+        for pair, (asset, duration, referenced) in zip(unique, results):
+            norm = (os.path.abspath(pair[0]), pair[1].rstrip('/'))
+            uploaded[norm] = asset
+            # a mock session accepts files that are not available locally
+            self._sizes[norm] = (os.path.getsize(pair[0])
+                                 if os.path.exists(pair[0]) else 0)
+            self._durations[norm] = duration
+            if referenced:
+                self._referenced.add(norm)
+
+        assets = {}
+        for key, filename, remote_folder in self._requests:
+            assets[key] = uploaded[
+                (os.path.abspath(filename), remote_folder.rstrip('/'))]
+        return assets
+
+    def report(self):
+        """Returns a summary of bytes and time saved by the last `execute()`.
+
+        The naive cost is what uploading every request serially would have
+        taken, using the measured time of each unique upload. Only the files
+        actually uploaded count as sent, not the ones referenced from the
+        upload cache.
+        """
+        naive_bytes = 0
+        naive_time = 0.0
+        for (_, filename, remote_folder), count in self._requests.items():
+            norm = (os.path.abspath(filename), remote_folder.rstrip('/'))
+            naive_bytes += self._sizes.get(norm, 0) * count
+            naive_time += self._durations.get(norm, 0.0) * count
+        sent_bytes = sum(size for norm, size in self._sizes.items()
+                         if norm not in self._referenced)
+        return ('uploads: {} requested, {} unique, {} already uploaded, '
+                '{} bytes sent ({} bytes saved), {:.2f}s wall time '
+                '({:.2f}s saved)').format(
+                    sum(self._requests.values()), len(self._sizes),
+                    len(self._referenced), sent_bytes,
+                    naive_bytes - sent_bytes, self._wall_time,
+                    max(0.0, naive_time - self._wall_time))